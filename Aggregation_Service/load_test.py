@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Streamlit'))
+import stops_queries as sq  # noqa: E402
+
+# Local load test for stops_service.py: replays a random mix of dashboard requests from
+# concurrent clients and reports throughput, latency percentiles and the cache hit rate.
+#   python Aggregation_Service/load_test.py --requests 5000 --concurrency 32
+# Without --url a server is started in-process on a free port.
+
+YEARS = ['2020', '2021']
+VIEWS = ['Counts', 'Percents']
+COLUMNS = ['Driver_Gender', 'Driver_Ethnicity', 'Driver_Age']
+
+
+def _subset(rng, options):
+    return rng.sample(options, rng.randint(1, len(options)))
+
+
+def random_request(rng):
+    years = _subset(rng, YEARS)
+    name = rng.choice(['stops_by_race_month', 'result_by_search', 'searches_by',
+                       'division_race_proportions', 'searches_by_service_bucket'])
+    params = {'years': years}
+    if name in ('stops_by_race_month', 'result_by_search'):
+        params['races'] = _subset(rng, sq.RACE_ORDER)
+    if name in ('division_race_proportions', 'searches_by_service_bucket'):
+        params['divisions'] = _subset(rng, sq.DIVISION_ORDER)
+    if name in ('result_by_search', 'searches_by_service_bucket'):
+        params['view'] = rng.choice(VIEWS)
+    if name == 'searches_by':
+        params['column'] = rng.choice(COLUMNS)
+    return '/queries/{}?{}'.format(name, urlencode(params, doseq=True))
+
+
+def run_load_test(url, requests=2000, concurrency=16, seed=0):
+    rng = random.Random(seed)
+    paths = [random_request(rng) for _ in range(requests)]
+    latencies = np.zeros(requests)
+    errors = []
+    lock = threading.Lock()
+
+    def fetch(i):
+        start = time.perf_counter()
+        try:
+            with urlopen(url + paths[i], timeout=30) as response:
+                response.read()
+        except Exception as e:
+            with lock:
+                errors.append('{}: {}'.format(paths[i], e))
+        latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(fetch, range(requests)))
+    seconds = time.perf_counter() - start
+
+    with urlopen(url + '/health', timeout=30) as response:
+        health = json.load(response)
+    return {
+        'requests': requests, 'concurrency': concurrency, 'seconds': seconds,
+        'requests_per_second': requests / seconds, 'errors': len(errors), 'error_samples': errors[:5],
+        'latency_ms': {'p50': 1000 * np.percentile(latencies, 50), 'p95': 1000 * np.percentile(latencies, 95),
+                       'p99': 1000 * np.percentile(latencies, 99), 'max': 1000 * latencies.max()},
+        'cache': health['cache'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the stops aggregation service.')
+    parser.add_argument('--url', help='running service (default: start one in-process)')
+    parser.add_argument('--csv', default='Streamlit/stops_2020_trimmed.csv')
+    parser.add_argument('--snapshot', default='Streamlit/stops_snapshot')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, help='server thread pool size (in-process server only)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        from stops_service import WORKERS, make_server
+        server = make_server(sq.load_stops(args.csv, args.snapshot), port=0, workers=args.workers or WORKERS)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://{}:{}'.format(*server.server_address)
+    try:
+        print(json.dumps(run_load_test(url.rstrip('/'), args.requests, args.concurrency, args.seed), indent=2))
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,170 @@
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Streamlit'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing_and_Modeling'))
+from officer_index import SERVICE_LABELS, service_bucket  # noqa: E402
+from stops_queries import RACE_ORDER, division_order  # noqa: E402
+
+# Precomputed count cubes over the dashboard stops frame (Streamlit/stops_queries.py).
+# Each cube is a dense n-dimensional array of stop counts, built with one np.bincount;
+# a dashboard query only slices and sums a few thousand cells instead of scanning rows.
+# The query functions at the bottom return the same tables as their stops_queries.py
+# counterparts; Was_a_Search_Conducted keeps the dashboard's (flipped) meaning.
+
+CUBES = {
+    'race_month': ['year', 'Driver_Race', 'Month_of_Stop'],
+    'result_search': ['year', 'Driver_Race', 'Was_a_Search_Conducted', 'Result_of_Stop'],
+    'division_race': ['year', 'CMPD_Division', 'Driver_Race'],
+    'service_race': ['year', 'CMPD_Division', 'Was_a_Search_Conducted', 'Officer_Years_of_Service', 'Driver_Race'],
+    'search_driver': ['year', 'Was_a_Search_Conducted', 'Driver_Gender', 'Driver_Ethnicity', 'Driver_Age'],
+}
+
+
+def _json_label(label):
+    if isinstance(label, (datetime.date, pd.Timestamp)):
+        return label.isoformat()
+    if isinstance(label, np.generic):
+        return label.item()
+    return label
+
+
+def _codes(column, name):
+    if name == 'CMPD_Division':
+        column = column.astype('category').cat.rename_categories(lambda c: c.replace(' Division', ''))
+    categorical = column if isinstance(column.dtype, pd.CategoricalDtype) else column.astype('category')
+    categorical = categorical.cat.remove_unused_categories()
+    labels = [_json_label(c) for c in categorical.cat.categories]
+    return categorical.cat.codes.to_numpy(), labels
+
+
+class Cube:
+
+    def __init__(self, stops, dims):
+        self.dims = list(dims)
+        codes, self.labels = [], {}
+        for dim in self.dims:
+            c, labels = _codes(stops[dim], dim)
+            codes.append(c)
+            self.labels[dim] = labels
+        shape = tuple(len(self.labels[d]) for d in self.dims)
+        # rows with a missing value in any dimension (code -1) are not counted
+        valid = np.logical_and.reduce([c >= 0 for c in codes]) if codes else np.ones(len(stops), bool)
+        flat = np.ravel_multi_index([c[valid] for c in codes], shape) if codes else np.zeros(valid.sum(), int)
+        self.counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+
+    def query(self, by, filters=None):
+        # Counts grouped by the `by` dimensions, restricted to the filter labels
+        # (dimension -> list of labels); empty or missing filters keep everything.
+        filters = filters or {}
+        unknown = [d for d in list(by) + list(filters) if d not in self.labels]
+        if unknown:
+            raise KeyError('unknown dimension(s): {}'.format(', '.join(unknown)))
+        counts = self.counts
+        kept = {}
+        for axis, dim in enumerate(self.dims):
+            labels = self.labels[dim]
+            wanted = filters.get(dim)
+            if wanted:
+                positions = [i for i, label in enumerate(labels) if label in set(wanted)]
+                counts = np.take(counts, positions, axis=axis)
+                labels = [labels[i] for i in positions]
+            kept[dim] = labels
+        drop = tuple(axis for axis, dim in enumerate(self.dims) if dim not in by)
+        counts = counts.sum(axis=drop)
+        order = [d for d in self.dims if d in by]
+        counts = np.transpose(counts, [order.index(d) for d in by])
+        index = pd.MultiIndex.from_product([kept[d] for d in by], names=list(by))
+        return pd.Series(counts.ravel(), index=index, name='count')
+
+    def describe(self):
+        return {'dims': self.dims, 'labels': self.labels, 'stops': int(self.counts.sum())}
+
+
+def build_cubes(stops, cubes=CUBES):
+    return {name: Cube(stops, dims) for name, dims in cubes.items()}
+
+
+def _matching(labels, selected_options):
+    # str.contains('|'.join(options)) on the labels, as the dashboard filters races and divisions
+    if not selected_options:
+        return list(labels)
+    return [label for label in labels if any(str(o) in str(label) for o in selected_options)]
+
+
+def _observed_table(counts, index, columns):
+    table = counts.unstack(columns)
+    table = table.loc[table.sum(axis=1) > 0, table.sum(axis=0) > 0]
+    table.index.name, table.columns.name = index, columns
+    return table
+
+
+def _race_columns(table):
+    return table[[race for race in RACE_ORDER if race in table.columns]]
+
+
+def stops_by_race_month(cubes, selected_year, selected_options):
+    counts = cubes['race_month'].query(['Driver_Race', 'Month_of_Stop'], {'year': selected_year})
+    data = counts[counts > 0].rename('Officer_Race').reset_index()
+    if selected_options:
+        data = data[data['Driver_Race'].isin(selected_options)]
+    return data
+
+
+def result_by_search(cubes, selected_year, selected_options, view='Counts'):
+    cube = cubes['result_search']
+    races = _matching(cube.labels['Driver_Race'], selected_options)
+    counts = cube.query(['Was_a_Search_Conducted', 'Result_of_Stop'], {'year': selected_year, 'Driver_Race': races})
+    counts.index = counts.index.set_levels([str(int(v)) for v in counts.index.levels[0]], level=0)
+    table = _observed_table(counts, 'Was_a_Search_Conducted', 'Result_of_Stop')
+    if view == 'Counts':
+        return table
+    return table.div(table.sum(axis=1), axis=0) * 100
+
+
+def searches_by(cubes, selected_year, column):
+    counts = cubes['search_driver'].query(['Was_a_Search_Conducted', column],
+                                          {'year': selected_year, 'Was_a_Search_Conducted': [True]})
+    counts = counts[counts > 0]
+    if column == 'Driver_Age':
+        ages = counts.droplevel(0)
+        return pd.Series(np.repeat(ages.index.to_numpy(), ages.to_numpy()), name='Driver_Age')
+    return _observed_table(counts, column, 'Was_a_Search_Conducted')
+
+
+def division_race_proportions(cubes, selected_year, selected_options):
+    divisions = division_order(selected_options)
+    counts = cubes['division_race'].query(['CMPD_Division', 'Driver_Race'],
+                                          {'year': selected_year, 'CMPD_Division': divisions})
+    table = _observed_table(counts, 'CMPD_Division', 'Driver_Race')
+    table = table.div(table.sum(axis=1), axis=0)
+    return _race_columns(table).loc[[d for d in divisions if d in table.index]]
+
+
+def searches_by_service_bucket(cubes, selected_year, selected_options, view='Counts'):
+    cube = cubes['service_race']
+    divisions = _matching(cube.labels['CMPD_Division'], selected_options)
+    counts = cube.query(['Officer_Years_of_Service', 'Driver_Race'],
+                        {'year': selected_year, 'Was_a_Search_Conducted': [True], 'CMPD_Division': divisions})
+    years = counts.index.get_level_values('Officer_Years_of_Service')
+    # the officer index's buckets, in SERVICE_LABELS order
+    buckets = pd.Categorical.from_codes(service_bucket(years), SERVICE_LABELS, ordered=True)
+    counts = counts.groupby([buckets, counts.index.get_level_values('Driver_Race')], observed=True).sum()
+    table = _race_columns(_observed_table(counts, 'Officer_Years_of_Service', 'Driver_Race'))
+    table.index = pd.Index(table.index.astype(str), name='Officer_Years_of_Service')
+    if view == 'Counts':
+        return table
+    return table.div(table.sum(axis=1), axis=0)
+
+
+QUERIES = {
+    'stops_by_race_month': (stops_by_race_month, ['years', 'races']),
+    'result_by_search': (result_by_search, ['years', 'races', 'view']),
+    'searches_by': (searches_by, ['years', 'column']),
+    'division_race_proportions': (division_race_proportions, ['years', 'divisions']),
+    'searches_by_service_bucket': (searches_by_service_bucket, ['years', 'divisions', 'view']),
+}
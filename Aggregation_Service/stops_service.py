@@ -0,0 +1,195 @@
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Streamlit'))
+import stops_queries as sq  # noqa: E402
+from stops_cubes import QUERIES, build_cubes  # noqa: E402
+
+# Local HTTP/JSON service answering the dashboard aggregations from precomputed cubes,
+# so the Streamlit and Shiny front ends can stay thin clients. Run from the repository root:
+#   python Aggregation_Service/stops_service.py --port 8050
+#
+#   GET /health                               rows, cube sizes, cache statistics
+#   GET /cubes                                dimensions and labels of every cube
+#   GET /cubes/<cube>?by=dim,dim&<dim>=label  raw counts, e.g. for the Shiny app
+#   GET /queries/<query>?years=2020&years=2021&races=Black&view=Percents
+#
+# List parameters are repeated (years=2020&years=2021). Tables come back as
+# {"index": [...], "columns": [...], "data": [[...]], "index_name": ..., "columns_name": ...};
+# series as {"index": [...], "data": [...], "name": ...}.
+
+CACHE_SIZE = 1024
+WORKERS = 8
+LIST_PARAMS = ('years', 'races', 'divisions')
+DEFAULTS = {'view': 'Counts', 'column': 'Driver_Gender'}
+# Accepted values of the scalar parameters; anything else (including an empty value) is a 400
+CHOICES = {'view': ('Counts', 'Percents')}
+
+
+def _value(v):
+    return v.item() if hasattr(v, 'item') else v
+
+
+def _labels(index):
+    return [[_value(v) for v in label] if isinstance(label, tuple) else _value(label) for label in index]
+
+
+def to_payload(result):
+    if isinstance(result, pd.Series):
+        return {'index': _labels(result.index), 'data': result.tolist(), 'name': result.name,
+                'index_name': result.index.names if result.index.nlevels > 1 else result.index.name}
+    return {'index': _labels(result.index), 'columns': _labels(result.columns),
+            'data': result.to_numpy().tolist(), 'index_name': result.index.name,
+            'columns_name': result.columns.name}
+
+
+class StopsService:
+
+    def __init__(self, stops, cache_size=CACHE_SIZE):
+        start = time.perf_counter()
+        self.rows = len(stops)
+        self.cubes = build_cubes(stops)
+        self.build_seconds = time.perf_counter() - start
+        # Responses are encoded once per normalised request and shared by every later hit
+        self.answer = functools.lru_cache(maxsize=cache_size)(self._encoded)
+
+    @staticmethod
+    def request_key(path, query):
+        # Parameter order and duplicate list entries do not change the answer
+        params = parse_qs(query, keep_blank_values=True)
+        return path.rstrip('/'), tuple(sorted((k, tuple(sorted(set(v)))) for k, v in params.items()))
+
+    def _encoded(self, path, params):
+        return json.dumps(self._answer(path, params)).encode()
+
+    def _answer(self, path, params):
+        params = dict(params)
+        parts = [p for p in path.split('/') if p]
+        if parts == ['cubes']:
+            return {name: cube.describe() for name, cube in self.cubes.items()}
+        if len(parts) == 2 and parts[0] == 'cubes' and parts[1] in self.cubes:
+            cube = self.cubes[parts[1]]
+            by = [d for v in params.pop('by', ()) for d in v.split(',') if d]
+            filters = {dim: [self._label(cube, dim, v) for v in values] for dim, values in params.items()}
+            return to_payload(cube.query(by, filters))
+        if len(parts) == 2 and parts[0] == 'queries' and parts[1] in QUERIES:
+            query, names = QUERIES[parts[1]]
+            args = [list(params.get(n, ())) if n in LIST_PARAMS else self._scalar(params, n) for n in names]
+            return to_payload(query(self.cubes, *args))
+        raise LookupError(path)
+
+    @staticmethod
+    def _scalar(params, name):
+        value = params.get(name, (DEFAULTS[name],))[0]
+        if not value or value not in CHOICES.get(name, (value,)):
+            raise ValueError('invalid {}: {!r}'.format(name, value))
+        return value
+
+    @staticmethod
+    def _label(cube, dim, value):
+        # Query strings are text; match them against the cube's typed labels
+        for label in cube.labels.get(dim, ()):
+            if str(label) == value or (isinstance(label, bool) and value.lower() in (str(int(label)), str(label).lower())):
+                return label
+        return value
+
+    def health(self):
+        info = self.answer.cache_info()
+        return {'rows': self.rows, 'build_seconds': self.build_seconds,
+                'cubes': {name: int(cube.counts.size) for name, cube in self.cubes.items()},
+                'cache': {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}}
+
+
+class StopsRequestHandler(BaseHTTPRequestHandler):
+    service = None
+    verbose = False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path.rstrip('/') == '/health':
+                body = json.dumps(self.service.health()).encode()
+            else:
+                body = self.service.answer(*self.service.request_key(url.path, url.query))
+            status = 200
+        except (LookupError, ValueError) as e:
+            body, status = json.dumps({'error': 'bad request: {}'.format(e)}).encode(), 400
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+class PooledHTTPServer(HTTPServer):
+    # Serves each connection on a fixed-size thread pool rather than a thread per request
+    # the default listen backlog of 5 drops bursts of concurrent connections
+    request_queue_size = 128
+    allow_reuse_address = True
+
+    def __init__(self, address, handler, workers=WORKERS):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def make_server(stops, host='127.0.0.1', port=8050, workers=WORKERS, cache_size=CACHE_SIZE, verbose=False):
+    service = StopsService(stops, cache_size)
+
+    class Handler(StopsRequestHandler):
+        pass
+
+    Handler.service = service
+    Handler.verbose = verbose
+    return PooledHTTPServer((host, port), Handler, workers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the dashboard aggregations over HTTP/JSON.')
+    parser.add_argument('--csv', default='Streamlit/stops_2020_trimmed.csv')
+    parser.add_argument('--snapshot', default='Streamlit/stops_snapshot')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE)
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    server = make_server(sq.load_stops(args.csv, args.snapshot), args.host, args.port, args.workers,
+                         args.cache_size, args.verbose)
+    health = server.RequestHandlerClass.service.health()
+    print('{} stops in {} cubes ({:.2f}s), serving on http://{}:{}'.format(
+        health['rows'], len(health['cubes']), health['build_seconds'], args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
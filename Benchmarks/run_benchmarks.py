@@ -0,0 +1,488 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Wall-time and peak-memory benchmarks for the preprocessing script, the modelling
+# helpers and the Streamlit page aggregations, run against synthetic extracts.
+#
+#   python Benchmarks/run_benchmarks.py --rows 100000 1000000
+#   python Benchmarks/run_benchmarks.py --rows 100000 --compare Benchmarks/results/<old>.json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+MODELING_DIR = os.path.join(ROOT, 'Preprocessing_and_Modeling')
+STREAMLIT_DIR = os.path.join(ROOT, 'Streamlit')
+SERVICE_DIR = os.path.join(ROOT, 'Aggregation_Service')
+RESULTS_DIR = os.path.join(HERE, 'results')
+
+for path in (HERE, MODELING_DIR, STREAMLIT_DIR, SERVICE_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+from synthetic_stops import write_raw_extracts  # noqa: E402
+from CMPD_preprocessing import RAW_FILES, run_pipeline as run_preprocessing  # noqa: E402
+from compaction import compact_stops, expand_flags  # noqa: E402
+
+BENCHMARKS = []
+
+
+def benchmark(name, requires=()):
+    # Registers a setup function that returns the zero-argument callable to time
+    def register(setup):
+        BENCHMARKS.append((name, tuple(requires), setup))
+        return setup
+    return register
+
+
+def available(module):
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def quiet(cwd=None):
+    old_cwd = os.getcwd()
+    if cwd is not None:
+        os.chdir(cwd)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            yield
+    finally:
+        os.chdir(old_cwd)
+
+
+class Fixtures:
+    # Synthetic inputs for one row count, built lazily and outside the timed region
+
+    def __init__(self, rows, workdir, seed=0):
+        self.rows = rows
+        self.workdir = workdir
+        self.seed = seed
+        self._cache = {}
+
+    def _cached(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def raw_dir(self):
+        return self._cached('raw_dir', lambda: write_raw_extracts(self.workdir, self.rows, seed=self.seed))
+
+    @property
+    def raw_paths(self):
+        return [os.path.join(self.raw_dir, os.path.basename(p)) for p in RAW_FILES]
+
+    @property
+    def processed(self):
+        # stops_2020_trimmed as it comes back from the exported csv
+        def build():
+            with quiet():
+                trimmed = run_preprocessing(self.raw_paths, quiet=True)[0]['stops_2020_trimmed']
+            trimmed = trimmed.reset_index().rename(columns={'index': 'Unnamed: 0'})
+            trimmed['Month_of_Stop'] = trimmed['Month_of_Stop'].dt.strftime('%Y-%m-%d')
+            return compact_stops(trimmed)
+        return self._cached('processed', build)
+
+    @property
+    def split(self):
+        def build():
+            from sklearn.model_selection import train_test_split
+            train, test = train_test_split(self.processed, test_size=.25, random_state=101)
+            return train.reset_index(drop=True), test.reset_index(drop=True)
+        return self._cached('split', build)
+
+    @property
+    def normal(self):
+        def build():
+            from modeling_functions import prepare_normal
+            train, test = self.split
+            return prepare_normal(train, 'Was_a_Search_Conducted') + prepare_normal(test, 'Was_a_Search_Conducted')
+        return self._cached('normal', build)
+
+    @property
+    def dashboard_csv(self):
+        # stops_2020_trimmed.csv as exported by the pipeline
+        def build():
+            path = os.path.join(self.workdir, 'stops_2020_trimmed.csv')
+            expand_flags(self.processed).set_index('Unnamed: 0').to_csv(path)
+            return path
+        return self._cached('dashboard_csv', build)
+
+    @property
+    def dashboard(self):
+        def build():
+            import stops_queries
+            return compact_stops(stops_queries.prepare_stops(self.processed.copy()))
+        return self._cached('dashboard', build)
+
+
+@benchmark('preprocessing.pipeline')
+def bench_preprocessing(fx):
+    paths = fx.raw_paths
+    output_dir = os.path.join(fx.workdir, 'Processed_Data')
+
+    def run():
+        with quiet():
+            return run_preprocessing(paths, output_dir, quiet=True)[1]
+    return run
+
+
+@benchmark('preprocessing.pipeline_diagnostics')
+def bench_preprocessing_diagnostics(fx):
+    # Same run with the exploratory scans switched on, to show what quiet mode saves
+    paths = fx.raw_paths
+
+    def run():
+        with quiet():
+            return run_preprocessing(paths, quiet=False)[1]
+    return run
+
+
+@benchmark('preprocessing.validate')
+def bench_validate(fx):
+    from validation import ValidationReport
+    raw = pd.read_csv(fx.raw_paths[0])
+    raw['Month_of_Stop'] = pd.to_datetime(raw['Month_of_Stop'], errors='coerce')
+    ids = raw['OBJECTID'].to_numpy()
+    return lambda: ValidationReport('quarantine').validate(raw, ids)
+
+
+@benchmark('modeling.OH_Encode')
+def bench_oh_encode(fx):
+    from modeling_functions import OH_Encode
+    train, _ = fx.split
+    return lambda: OH_Encode(train, ['Reason_for_Stop', 'CMPD_Division', 'Officer_Race'])
+
+
+@benchmark('modeling.prepare_normal')
+def bench_prepare_normal(fx):
+    from modeling_functions import prepare_normal
+    train, _ = fx.split
+    return lambda: prepare_normal(train, 'Was_a_Search_Conducted')
+
+
+@benchmark('modeling.prepare_contrast')
+def bench_prepare_contrast(fx):
+    from modeling_functions import prepare_contrast
+    train, _ = fx.split
+    return lambda: prepare_contrast(train, 'Was_a_Search_Conducted')
+
+
+@benchmark('modeling.upsample_process', requires=['imblearn'])
+def bench_upsample(fx):
+    from modeling_functions import upsample_process
+    train, _ = fx.split
+
+    def run():
+        with quiet():
+            upsample_process(train, 'Was_a_Search_Conducted')
+    return run
+
+
+@benchmark('modeling.train_eval', requires=['matplotlib'])
+def bench_train_eval(fx):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import GaussianNB
+    from modeling_functions import train_eval
+    import matplotlib.pyplot as plt
+    X_train, T_train, X_test, T_test = fx.normal
+
+    def run():
+        with quiet():
+            for name, model in [('Logistic Reg', LogisticRegression(max_iter=500)), ('GaussianNB', GaussianNB())]:
+                train_eval(model, X_train, T_train, X_test, T_test, {'clf': name, 'data': 'Charlotte Policing'})
+        plt.close('all')
+    return run
+
+
+@benchmark('modeling.cross_validate')
+def bench_cross_validate(fx):
+    from experiments import MODELS, run_experiments
+    train = fx.split[0]
+    models = {name: MODELS[name] for name in ('Logistic Reg', 'GaussianNB')}
+    # no result store, so every repeat fits all folds
+    return lambda: run_experiments(train, models=models, folds=3, n_jobs=1, store=None)
+
+
+@benchmark('modeling.evaluate')
+def bench_evaluate(fx):
+    from sklearn.linear_model import LogisticRegression
+    from evaluation import evaluate
+    X_train, T_train, X_test, T_test = fx.normal
+    clf = LogisticRegression(max_iter=500).fit(X_train, T_train)
+    groups = fx.split[1]['Driver_Race'].to_numpy()
+    return lambda: evaluate(clf, X_test, T_test, groups).to_dict()
+
+
+@benchmark('modeling.train_targets')
+def bench_train_targets(fx):
+    from experiments import MODELS
+    from multi_target import train_targets
+    train, test = fx.split
+    models = {name: MODELS[name] for name in ('Logistic Reg', 'GaussianNB')}
+    return lambda: train_targets(train, test, models=models, n_jobs=1)
+
+
+@benchmark('modeling.share_matrices')
+def bench_share_matrices(fx):
+    import shutil
+    from shared_matrices import matrices_path, share_matrices
+    X_train, T_train, X_test, T_test = fx.normal
+
+    def run():
+        shared = share_matrices({'X_train': X_train, 'T_train': T_train, 'X_test': X_test, 'T_test': T_test})
+        shutil.rmtree(matrices_path(shared))
+    return run
+
+
+@benchmark('stats.disparity_test')
+def bench_disparity_test(fx):
+    from significance import disparity_test
+    stops = fx.processed
+    return lambda: disparity_test(stops, outcome='Arrest', by=['CMPD_Division', 'year'], replicates=2000)
+
+
+@benchmark('monitor.update_month')
+def bench_monitor_update(fx):
+    import tempfile
+    from drift_monitor import DriftMonitor
+    from stop_labels import month_labels
+    stops = fx.processed
+    months = month_labels(stops['Month_of_Stop'])
+    last = months.categories[-1]
+    monitor = DriftMonitor(tempfile.mkdtemp(prefix='cmpd_monitor_'))
+    monitor.update(stops[np.asarray(months) != last])
+    newest = stops[np.asarray(months) == last]
+    return lambda: monitor.update(newest, refresh=[last])
+
+
+@benchmark('monitor.monthly_drift')
+def bench_monthly_drift(fx):
+    import tempfile
+    from drift_monitor import DIMENSIONS, DriftMonitor
+    monitor = DriftMonitor(tempfile.mkdtemp(prefix='cmpd_monitor_'))
+    monitor.update(fx.processed)
+    return lambda: [monitor.monthly_drift(dimension) for dimension in DIMENSIONS]
+
+
+@benchmark('streamlit.load_csv')
+def bench_load_csv(fx):
+    import stops_queries
+    csv_path = fx.dashboard_csv
+    return lambda: stops_queries.load_stops(csv_path, os.path.join(fx.workdir, 'no_snapshot'))
+
+
+@benchmark('streamlit.load_snapshot')
+def bench_load_snapshot(fx):
+    import stops_queries
+    snapshot = os.path.join(fx.workdir, 'stops_snapshot')
+    stops_queries.build_snapshot(fx.dashboard_csv, snapshot)
+    return lambda: stops_queries.load_stops(fx.dashboard_csv, snapshot)
+
+
+def _dashboard_benchmark(name, query):
+    @benchmark('streamlit.' + name)
+    def setup(fx):
+        import stops_queries
+        stops = fx.dashboard
+        return lambda: query(stops_queries, stops)
+    return setup
+
+
+ALL_RACES = ["White", "Black", "Asian", "Native American", "Other/Unknown"]
+ALL_DIVISIONS = ["Metro", "North Tryon", "North", "University City", "Central", "Freedom", "Westover",
+                 "Hickory Grove", "Independence", "Eastway", "Steele Creek", "Providence", "South"]
+YEARS = ['2020', '2021']
+
+_dashboard_benchmark('stops_by_race_month', lambda sq, s: sq.stops_by_race_month(s, YEARS, ALL_RACES))
+_dashboard_benchmark('result_by_search', lambda sq, s: sq.result_by_search(s, YEARS, ALL_RACES, 'Percents'))
+_dashboard_benchmark('searches_by', lambda sq, s: sq.searches_by(s, YEARS, 'Driver_Gender'))
+_dashboard_benchmark('division_race_proportions',
+                     lambda sq, s: sq.division_race_proportions(s, YEARS, ALL_DIVISIONS))
+_dashboard_benchmark('searches_by_service_bucket',
+                     lambda sq, s: sq.searches_by_service_bucket(s, YEARS, ALL_DIVISIONS, 'Percents'))
+
+
+@benchmark('officer.build_index')
+def bench_officer_index(fx):
+    from officer_index import index_counts
+    stops = fx.processed
+    return lambda: index_counts(stops)
+
+
+@benchmark('streamlit.indexed_searches_by_service_bucket')
+def bench_indexed_service_bucket(fx):
+    import tempfile
+    import stops_queries
+    from officer_index import OfficerIndex
+    index = OfficerIndex(tempfile.mkdtemp(prefix='cmpd_officer_index_'))
+    index.update(fx.processed)
+    return lambda: stops_queries.indexed_searches_by_service_bucket(index, YEARS, ALL_DIVISIONS, 'Percents')
+
+
+@benchmark('service.build_cubes')
+def bench_build_cubes(fx):
+    from stops_cubes import build_cubes
+    stops = fx.dashboard
+    return lambda: build_cubes(stops)
+
+
+def _service_benchmark(name, query):
+    # The same page queries answered from the precomputed cubes (no response cache)
+    @benchmark('service.' + name)
+    def setup(fx):
+        import stops_cubes
+        cubes = stops_cubes.build_cubes(fx.dashboard)
+        return lambda: query(stops_cubes, cubes)
+    return setup
+
+_service_benchmark('stops_by_race_month', lambda sc, c: sc.stops_by_race_month(c, YEARS, ALL_RACES))
+_service_benchmark('result_by_search', lambda sc, c: sc.result_by_search(c, YEARS, ALL_RACES, 'Percents'))
+_service_benchmark('searches_by', lambda sc, c: sc.searches_by(c, YEARS, 'Driver_Gender'))
+_service_benchmark('division_race_proportions',
+                   lambda sc, c: sc.division_race_proportions(c, YEARS, ALL_DIVISIONS))
+_service_benchmark('searches_by_service_bucket',
+                   lambda sc, c: sc.searches_by_service_bucket(c, YEARS, ALL_DIVISIONS, 'Percents'))
+
+
+def measure(run, repeat, track_memory):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = run()
+        times.append(time.perf_counter() - start)
+    peak = None
+    if track_memory:
+        # Separate pass: tracemalloc slows allocation-heavy code down noticeably
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    stats = {
+        'wall_seconds_min': min(times),
+        'wall_seconds_median': float(np.median(times)),
+        'repeat': repeat,
+        'peak_bytes': peak,
+    }
+    if hasattr(out, 'records'):
+        # Stage breakdown from the StageRecorder of the last timed run
+        stats['stages'] = {r['stage']: r['seconds'] for r in out.records}
+    return stats
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(rows_list, pattern=None, repeat=3, track_memory=True, seed=0):
+    results = []
+    for rows in rows_list:
+        with tempfile.TemporaryDirectory(prefix='cmpd_bench_') as workdir:
+            fx = Fixtures(rows, workdir, seed)
+            for name, requires, setup in BENCHMARKS:
+                if pattern and not re.search(pattern, name):
+                    continue
+                missing = [m for m in requires if not available(m)]
+                if missing:
+                    print('{:<45} {:>10}  skipped (missing {})'.format(name, rows, ', '.join(missing)))
+                    continue
+                stats = measure(setup(fx), repeat, track_memory)
+                stats.update(name=name, rows=rows)
+                results.append(stats)
+                peak = stats['peak_bytes']
+                print('{:<45} {:>10}  {:>9.3f}s  {:>10}'.format(
+                    name, rows, stats['wall_seconds_min'],
+                    '-' if peak is None else '{:.1f} MiB'.format(peak / 2 ** 20)))
+    return {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(old, new, threshold):
+    # Prints the new/old ratio per benchmark and returns the regressions
+    baseline = {(r['name'], r['rows']): r for r in old['results']}
+    regressions = []
+    print('\n{:<45} {:>10}  {:>8}  {:>8}'.format('benchmark', 'rows', 'time', 'memory'))
+    for r in new['results']:
+        before = baseline.get((r['name'], r['rows']))
+        if before is None:
+            continue
+        time_ratio = r['wall_seconds_min'] / before['wall_seconds_min']
+        mem_ratio = None
+        if r['peak_bytes'] and before['peak_bytes']:
+            mem_ratio = r['peak_bytes'] / before['peak_bytes']
+        flag = ''
+        if time_ratio > 1 + threshold or (mem_ratio or 0) > 1 + threshold:
+            regressions.append(r['name'])
+            flag = '  REGRESSION'
+        print('{:<45} {:>10}  {:>7.2f}x  {:>8}{}'.format(
+            r['name'], r['rows'], time_ratio, '-' if mem_ratio is None else '{:.2f}x'.format(mem_ratio), flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the CMPD traffic stop hot paths.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000],
+                        help='synthetic extract sizes to run (combined rows across both raw files)')
+    parser.add_argument('-k', '--select', help='regex over benchmark names')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak-memory pass')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results json (default: Benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier results json to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown or memory growth reported as a regression')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.rows, args.select, args.repeat, not args.no_memory, args.seed)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, report['created'].replace(':', '') + '.json')
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('\nwrote {}'.format(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), report, args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Synthetic Officer_Traffic_Stops extracts with the same schema as the two raw files
+# from the Charlotte Data Portal. Category shares are rounded from the 2016-17 and
+# 2020-21 extracts so that the group sizes seen by the pipeline look realistic.
+
+REASONS = {
+    'Vehicle Regulatory': 0.28, 'Speeding': 0.22, 'Stop Light/Sign': 0.12,
+    'Vehicle Equipment': 0.10, 'Safe Movement': 0.10, 'Investigation': 0.08,
+    'SeatBelt': 0.03, 'Other': 0.03, 'Driving While Impaired': 0.02, 'CheckPoint': 0.02,
+}
+OFFICER_RACES = {
+    'White': 0.70, 'Black/African American': 0.15, 'Hispanic/Latino': 0.07,
+    'Asian / Pacific Islander': 0.03, '2 or More': 0.03,
+    'American Indian/Alaska Native': 0.01, 'Not Specified': 0.01,
+}
+DRIVER_RACES = {'Black': 0.58, 'White': 0.31, 'Other/Unknown': 0.05, 'Asian': 0.05, 'Native American': 0.01}
+DIVISIONS = {
+    'Metro Division': 0.08, 'North Tryon Division': 0.09, 'North Division': 0.08,
+    'University City Division': 0.07, 'Central Division': 0.06, 'Freedom Division': 0.08,
+    'Westover Division': 0.09, 'Hickory Grove Division': 0.08, 'Independence Division': 0.07,
+    'Eastway Division': 0.08, 'Steele Creek Division': 0.07, 'Providence Division': 0.06,
+    'South Division': 0.07,
+}
+RESULTS = ['Arrest', 'Citation Issued', 'No Action Taken', 'Verbal Warning', 'Written Warning']
+# Result_of_Stop shares, conditional on whether a search was conducted
+RESULTS_NO_SEARCH = [0.02, 0.38, 0.08, 0.37, 0.15]
+RESULTS_SEARCH = [0.25, 0.30, 0.15, 0.22, 0.08]
+# Search rate per Driver_Race, in DRIVER_RACES order
+SEARCH_RATES = [0.055, 0.025, 0.02, 0.04, 0.03]
+
+MISSING_DIVISION = 0.02
+UNDERAGE_DRIVERS = 0.0003
+PERIODS = {'2016-17': ('2016-01', '2017-12'), '2020-21': ('2020-01', '2021-12')}
+
+
+def _draw(rng, table, n):
+    keys = list(table)
+    p = np.array([table[k] for k in keys])
+    return np.asarray(keys, dtype=object)[rng.choice(len(keys), size=n, p=p / p.sum())]
+
+
+def _months(period):
+    start, end = PERIODS[period]
+    return pd.period_range(start, end, freq='M').strftime('%Y/%m').to_numpy(dtype=object)
+
+
+def make_raw_stops(n, period='2020-21', seed=0):
+    # One raw extract of n stops in the portal's column layout
+    rng = np.random.default_rng(seed)
+    race_codes = rng.choice(len(DRIVER_RACES), size=n, p=list(DRIVER_RACES.values()))
+    searched = rng.random(n) < np.asarray(SEARCH_RATES)[race_codes]
+    results = np.where(searched,
+                       rng.choice(len(RESULTS), size=n, p=RESULTS_SEARCH),
+                       rng.choice(len(RESULTS), size=n, p=RESULTS_NO_SEARCH))
+
+    ages = np.clip(rng.gamma(4.0, 9.0, size=n).astype(np.int64) + 16, 16, 99)
+    underage = rng.random(n) < UNDERAGE_DRIVERS
+    ages[underage] = rng.integers(10, 15, size=underage.sum())
+
+    divisions = _draw(rng, DIVISIONS, n)
+    divisions[rng.random(n) < MISSING_DIVISION] = np.nan
+
+    stops = pd.DataFrame({
+        'Month_of_Stop': rng.choice(_months(period), size=n),
+        'Reason_for_Stop': _draw(rng, REASONS, n),
+        'Officer_Race': _draw(rng, OFFICER_RACES, n),
+        'Officer_Gender': np.where(rng.random(n) < 0.87, 'Male', 'Female'),
+        'Officer_Years_of_Service': np.minimum(rng.geometric(0.09, size=n) - 1, 36),
+        'Driver_Race': np.asarray(list(DRIVER_RACES), dtype=object)[race_codes],
+        'Driver_Ethnicity': np.where(rng.random(n) < 0.10, 'Hispanic', 'Non-Hispanic'),
+        'Driver_Gender': np.where(rng.random(n) < 0.60, 'Male', 'Female'),
+        'Driver_Age': ages,
+        'Was_a_Search_Conducted': np.where(searched, 'Yes', 'No'),
+        'Result_of_Stop': np.asarray(RESULTS, dtype=object)[results],
+        'CMPD_Division': divisions,
+    })
+    ids = np.arange(1, n + 1)
+    if period == '2016-17':
+        stops.insert(0, 'ObjectID', ids)
+        stops['CreationDate'] = '2018/03/01 00:00:00+00'
+        stops['Creator'] = 'CMPD'
+        stops['EditDate'] = '2018/03/01 00:00:00+00'
+        stops['Editor'] = 'CMPD'
+    else:
+        stops.insert(0, 'OBJECTID', ids)
+        stops['GlobalID'] = ['{%08X-0000-0000-0000-000000000000}' % i for i in ids]
+    return stops
+
+
+def iter_raw_stops(n, period='2020-21', chunksize=1_000_000, seed=0):
+    # Chunked generation so 50M-row extracts never sit in memory at once
+    offset = 0
+    for i, start in enumerate(range(0, n, chunksize)):
+        chunk = make_raw_stops(min(chunksize, n - start), period, seed=seed + i)
+        chunk.iloc[:, 0] += offset
+        offset += len(chunk)
+        yield chunk
+
+
+def write_raw_extracts(directory, n, share_2016=0.5, chunksize=1_000_000, seed=0):
+    # Writes both raw csvs under the file names CMPD_preprocessing.py reads
+    raw_dir = os.path.join(directory, 'Raw_Data')
+    os.makedirs(raw_dir, exist_ok=True)
+    n_2016 = int(n * share_2016)
+    files = {
+        'Officer_Traffic_Stops (1).csv': ('2020-21', n - n_2016, seed),
+        'Officer_Traffic_Stops_2016-17.csv': ('2016-17', n_2016, seed + 10_000),
+    }
+    for name, (period, rows, file_seed) in files.items():
+        path = os.path.join(raw_dir, name)
+        header = True
+        with open(path, 'w', newline='') as f:
+            for chunk in iter_raw_stops(rows, period, chunksize, file_seed):
+                chunk.to_csv(f, index=False, header=header)
+                header = False
+    return raw_dir
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write synthetic raw traffic stop extracts.')
+    parser.add_argument('directory')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--chunksize', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(write_raw_extracts(args.directory, args.rows, chunksize=args.chunksize, seed=args.seed))
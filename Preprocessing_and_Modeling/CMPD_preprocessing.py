@@ -1,170 +1,203 @@
+import argparse
+import os
+
 import pandas as pd
 import numpy as np
-
-stops = pd.read_csv("Raw_Data/Officer_Traffic_Stops (1).csv")
-stops2 = pd.read_csv("Raw_Data/Officer_Traffic_Stops_2016-17.csv")
-
-stops.head()
-
-stops = stops.drop(['OBJECTID','GlobalID'],1)
-
-stops2.head()
-
-stops2 = stops2.drop(['ObjectID','CreationDate','Creator','EditDate','Editor'],1)
-
-stops = stops.append(stops2, ignore_index=True)
-
-stops
-
-print(stops.isna().any())
-print(stops.dtypes)
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's. 48 entries for each month of 2020-2021, and 2016-2017.
-
-stops.Month_of_Stop.unique()
-
-# convert the 'Date' column to datetime format
-import datetime as dt
-isinstance(stops['Month_of_Stop'], dt.date) # False
-
-stops['Month_of_Stop'] = stops['Month_of_Stop'].astype('datetime64[ns]')
-stops['Month_of_Stop'] = pd.to_datetime(stops['Month_of_Stop'], format='%y%m%d')
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-
-stops.Reason_for_Stop.unique()
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-
-stops.Officer_Race.unique()
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-
-stops.Officer_Gender.unique()
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-
-stops.Officer_Years_of_Service.unique()
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-#Driver_Race options are not the same as Officer_Race options. Officers have 'Hispanic/Latino option, as well as a mixed race option.'
-
-stops.Driver_Race.unique()
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-
-stops.Driver_Ethnicity.unique()
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-
-stops.Driver_Gender.unique()
-
-#Checking for all ages
-#Ages below 15 (earliest age eligible for driver's permit) are recorded. Typo or someone illegally driving underage? Ages 10-14 represented
-#Keep in dataset or remove? 68 observations in this Driver_Age range
-
-a = stops.Driver_Age.unique()
-sorted(a)
-stops[stops['Driver_Age']<15]
-
-#reason for stop of drivers below drivers permit age
-#reasons do not appear to be specifically related to age. Reasons are not exclusive to officer observing a young driver behind the wheel.
-#Remove?
-young = stops[stops["Driver_Age"] <15]
-print(young.groupby('Reason_for_Stop').count())
-print(young.groupby('Result_of_Stop').count())
-
-stops = stops[stops["Driver_Age"]>14]
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-
-stops.Was_a_Search_Conducted.unique()
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-
-stops.Result_of_Stop.unique()
-
-#Checking for any typo's during data entry. Potential variations of the same input.
-#No typo's found.
-#Contains NULL values. For location analysis should remove. For aggregate demographic analysis is helpful.
-#Create 2nd version of the dataset??
-
-print(stops.CMPD_Division.unique())
-stops['CMPD_Division'].isna().sum()
-
-#Setting binary variables
-
 from sklearn.preprocessing import LabelEncoder
-label_encoder = LabelEncoder()
-stops['Officer_Gender'] = label_encoder.fit_transform(stops['Officer_Gender']) #0 female, 1 male
-stops['Driver_Ethnicity'] = label_encoder.fit_transform(stops['Driver_Ethnicity']) #0 Hispanic, 1 Non-Hispanic
-stops['Driver_Gender'] = label_encoder.fit_transform(stops['Driver_Gender']) #0 female, 1 male
-stops['Was_a_Search_Conducted'] = label_encoder.fit_transform(stops['Was_a_Search_Conducted']) # 0 yes, 1 no
-
-stops
-
-# Grouping Result_of_Stop into fewer categories. Combing 'No Action Taken', 'Verbal Warning', and 'Written Warning'
-stops['Outcome'] = pd.np.where(stops.Result_of_Stop.str.contains("Arrest"), "Arrest",
-                   pd.np.where(stops.Result_of_Stop.str.contains("Citation Issued"), "Citation","Warning/No Action"))
-
-stops['Arrest'] = pd.np.where(stops.Result_of_Stop.str.contains("Arrest"), "Arrest","Other")
-stops
-
-# Grouping Officer_Race into same racial groupings as Driver_Age to be able to determine if they match
-
-stops['Officer_Race'] = pd.np.where(stops.Officer_Race.str.contains("White"), "White",
-                pd.np.where(stops.Officer_Race.str.contains("Black/African American"), "Black",
-                pd.np.where(stops.Officer_Race.str.contains("Asian / Pacific Islander"), "Asian",
-                pd.np.where(stops.Officer_Race.str.contains("American Indian/Alaska Native"),"Native American","Other/Unknown"))))
-
-stops['Racial_Match'] = np.where(stops.Driver_Race == stops.Officer_Race,1,0)
-
-stops
-
-# all years dataset, and separating 2016-2017 from 2020-2021
-
-stops_all = stops
-
-stops_2016 = stops[stops['Month_of_Stop'] < '2018-01-01']
-
-stops_2020 = stops[stops['Month_of_Stop'] > '2018-01-01']
-
-stops_all_trimmed = stops_all.dropna()
-
-stops_2016_trimmed = stops_2016.dropna()
-
-stops_2020_trimmed = stops_2020.dropna()
-
-# compare proportion of trimmed rows to the total set along each variable.
-# Ensure there is a normal distribution of the missing CMPD divisions along other variables
-
-missing = stops_2020.loc[stops_2020.isnull().any(axis=1)]
-print(missing.groupby('Racial_Match').count())
-print(stops_2020.groupby('Racial_Match').count())
-
 from sklearn.model_selection import train_test_split
-stops_2020_train, stops_2020_test = train_test_split(stops_2020_trimmed,test_size = .25, random_state=101)
-
-print(stops_2020_train)
-print(stops_2020_test)
-
-# export to csv. Versions with all stops, and separated by year grouping. 
-# Then the same versions duplicated but with missing CMPD Division entries removed
-
-#only using 2020-2021 traffic stops ultimately
-
-# 2020-2021 with NAs removed
-#stops_2020_trimmed.to_csv('stops_2020_trimmed.csv')
-#stops_2020_train.to_csv('/stops_2020_train.csv')
-#stops_2020_test.to_csv('/stops_2020_test.csv')
 
+from stage_instrumentation import StageRecorder, PROFILERS
+from validation import ValidationReport, POLICIES, SCHEMA
+from compaction import compact_stops, expand_flags, frame_bytes, compaction_summary
+from drift_monitor import update_monitor
+from officer_index import update_officer_index
+
+# Preprocessing pipeline: ingest (streamed, with schema validation) -> clean -> recode
+# -> encode -> compact -> (monitor) -> split -> (officer index) -> export.
+# Every stage is timed by a StageRecorder. With quiet=True the exploratory scans
+# (unique values, group counts, frame printouts) are skipped entirely.
+
+RAW_FILES = ("Raw_Data/Officer_Traffic_Stops (1).csv", "Raw_Data/Officer_Traffic_Stops_2016-17.csv")
+ID_COLUMNS = ('OBJECTID', 'ObjectID')
+DROP_COLUMNS = (['OBJECTID', 'GlobalID'], ['ObjectID', 'CreationDate', 'Creator', 'EditDate', 'Editor'])
+CHUNKSIZE = 500_000
+NUMERIC_COLUMNS = [col for col, rule in SCHEMA.items() if 'range' in rule]
+
+
+def ingest(paths=RAW_FILES, report=None, chunksize=CHUNKSIZE):
+    # Streams both extracts chunk by chunk, validating every chunk against validation.SCHEMA.
+    # Rows violating the schema (e.g. drivers younger than 15) are dropped or quarantined
+    # according to the report's policy.
+    report = report if report is not None else ValidationReport()
+    frames = []
+    offset = 0
+    for path, drop in zip(paths, DROP_COLUMNS):
+        source = os.path.basename(path)
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            # row positions in the combined extract, as the index of the exported csvs
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            ids = chunk[[c for c in ID_COLUMNS if c in chunk][0]].to_numpy()
+            chunk = chunk.drop(drop, axis=1)
+            # convert the 'Date' column to datetime format; unparseable months fail validation
+            chunk['Month_of_Stop'] = pd.to_datetime(chunk['Month_of_Stop'], errors='coerce')
+            chunk = report.validate(chunk, ids, source)
+            # a chunk that held non-numeric ages or service years is still object dtype;
+            # give it the int64 (or float64, if values are left missing) of a clean chunk
+            for col in NUMERIC_COLUMNS:
+                if col in chunk and chunk[col].dtype == object:
+                    numbers = pd.to_numeric(chunk[col], errors='coerce').astype(float)
+                    whole = numbers.notna().all() and (numbers % 1 == 0).all()
+                    chunk[col] = numbers.astype(np.int64) if whole else numbers
+            frames.append(chunk)
+    return pd.concat(frames)
+
+
+def clean(stops, report=None, quiet=False):
+    #Typo checks (potential variations of the same input) and the under-age driver check
+    #now run as part of the schema validation during ingest. No typo's found in the 2016-17
+    #and 2020-21 extracts; ages 10-14 are recorded and are removed (or quarantined).
+    if not quiet:
+        print(stops.isna().any())
+        print(stops.dtypes)
+        if report is not None:
+            print(report.summary())
+        #Contains NULL values. For location analysis should remove. For aggregate demographic analysis is helpful.
+        print('CMPD_Division missing:', stops['CMPD_Division'].isna().sum())
+    return stops
+
+
+def recode(stops):
+    # Grouping Result_of_Stop into fewer categories. Combing 'No Action Taken', 'Verbal Warning', and 'Written Warning'
+    arrest = stops.Result_of_Stop.str.contains("Arrest")
+    stops['Outcome'] = np.where(arrest, "Arrest",
+                       np.where(stops.Result_of_Stop.str.contains("Citation Issued"), "Citation", "Warning/No Action"))
+    stops['Arrest'] = np.where(arrest, "Arrest", "Other")
+
+    # Grouping Officer_Race into same racial groupings as Driver_Race to be able to determine if they match
+    stops['Officer_Race'] = np.where(stops.Officer_Race.str.contains("White"), "White",
+                    np.where(stops.Officer_Race.str.contains("Black/African American"), "Black",
+                    np.where(stops.Officer_Race.str.contains("Asian / Pacific Islander"), "Asian",
+                    np.where(stops.Officer_Race.str.contains("American Indian/Alaska Native"), "Native American",
+                             "Other/Unknown"))))
+
+    stops['Racial_Match'] = np.where(stops.Driver_Race == stops.Officer_Race, 1, 0)
+    return stops
+
+
+def encode(stops):
+    #Setting binary variables
+    label_encoder = LabelEncoder()
+    stops['Officer_Gender'] = label_encoder.fit_transform(stops['Officer_Gender']) #0 female, 1 male
+    stops['Driver_Ethnicity'] = label_encoder.fit_transform(stops['Driver_Ethnicity']) #0 Hispanic, 1 Non-Hispanic
+    stops['Driver_Gender'] = label_encoder.fit_transform(stops['Driver_Gender']) #0 female, 1 male
+    stops['Was_a_Search_Conducted'] = label_encoder.fit_transform(stops['Was_a_Search_Conducted']) # 0 yes, 1 no
+    return stops
+
+
+def compact(stops, quiet=False):
+    # Categoricals, booleans and small integers from here on (see compaction.py)
+    compacted = compact_stops(stops)
+    if not quiet:
+        print('compact:', compaction_summary(frame_bytes(stops), frame_bytes(compacted)))
+    return compacted
+
+
+def split(stops, quiet=False):
+    # all years dataset, and separating 2016-2017 from 2020-2021
+    stops_2016 = stops[stops['Month_of_Stop'] < '2018-01-01']
+    stops_2020 = stops[stops['Month_of_Stop'] > '2018-01-01']
+    stops_2020_trimmed = stops_2020.dropna()
+
+    if not quiet:
+        # compare proportion of trimmed rows to the total set along each variable.
+        # Ensure there is a normal distribution of the missing CMPD divisions along other variables
+        missing = stops_2020.loc[stops_2020.isnull().any(axis=1)]
+        print(missing.groupby('Racial_Match').count())
+        print(stops_2020.groupby('Racial_Match').count())
+
+    stops_2020_train, stops_2020_test = train_test_split(stops_2020_trimmed, test_size=.25, random_state=101)
+
+    return {
+        'stops_all': stops,
+        'stops_2016': stops_2016,
+        'stops_2020': stops_2020,
+        'stops_all_trimmed': stops.dropna(),
+        'stops_2016_trimmed': stops_2016.dropna(),
+        'stops_2020_trimmed': stops_2020_trimmed,
+        'stops_2020_train': stops_2020_train,
+        'stops_2020_test': stops_2020_test,
+    }
+
+
+#only using 2020-2021 traffic stops ultimately, with NAs removed
+EXPORTS = ('stops_2020_trimmed', 'stops_2020_train', 'stops_2020_test')
+
+
+def export(datasets, output_dir=None, report=None, quiet=False):
+    if output_dir is None:
+        return datasets
+    os.makedirs(output_dir, exist_ok=True)
+    for name in EXPORTS:
+        expand_flags(datasets[name]).to_csv(os.path.join(output_dir, name + '.csv'))
+    if report is not None:
+        report.write_json(os.path.join(output_dir, 'validation_report.json'))
+        quarantine = report.quarantine()
+        if quarantine is not None:
+            # row: position in the combined extract, as the index of the exported csvs
+            quarantine.to_csv(os.path.join(output_dir, 'stops_quarantine.csv'), index_label='row')
+    return datasets
+
+
+def run_pipeline(paths=RAW_FILES, output_dir=None, quiet=False, recorder=None, report=None,
+                 chunksize=CHUNKSIZE, monitor_dir=None, officer_index_dir=None):
+    recorder = recorder if recorder is not None else StageRecorder()
+    report = report if report is not None else ValidationReport()
+    stops = recorder.run('ingest', ingest, paths, report=report, chunksize=chunksize)
+    # validation time of all chunks, already counted in ingest
+    recorder.add('ingest/validate', report.seconds, rows_in=report.rows, rows_out=len(stops), within='ingest')
+    stops = recorder.run('clean', clean, stops, report=report, quiet=quiet)
+    stops = recorder.run('recode', recode, stops)
+    stops = recorder.run('encode', encode, stops)
+    stops = recorder.run('compact', compact, stops, quiet=quiet)
+    if monitor_dir is not None:
+        # monthly drift aggregates, extended with the months not seen by earlier runs
+        stops = recorder.run('monitor', update_monitor, stops, monitor_dir, quiet=quiet)
+    datasets = recorder.run('split', split, stops, quiet=quiet)
+    if officer_index_dir is not None:
+        # built from the trimmed stops, so the dashboard's tables match the exported csvs
+        recorder.run('officer_index', update_officer_index, datasets['stops_all_trimmed'], officer_index_dir,
+                     quiet=quiet)
+    datasets = recorder.run('export', export, datasets, output_dir=output_dir, report=report, quiet=quiet)
+    return datasets, recorder
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Preprocess the CMPD officer traffic stop extracts.')
+    parser.add_argument('--raw', nargs=2, default=RAW_FILES, metavar=('STOPS_2020', 'STOPS_2016'))
+    parser.add_argument('--output-dir', default='Processed_Data')
+    parser.add_argument('--quiet', action='store_true', help='production mode: skip the diagnostic scans')
+    parser.add_argument('--invalid-rows', choices=POLICIES, default='drop',
+                        help='what to do with rows violating the schema (quarantine writes stops_quarantine.csv)')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    parser.add_argument('--profile', choices=PROFILERS)
+    parser.add_argument('--profile-stages', nargs='+', help='stages to profile (default: all)')
+    parser.add_argument('--profile-dir', help='write cProfile stats here instead of printing them')
+    parser.add_argument('--report', help='write the stage timings to this json file')
+    parser.add_argument('--monitor', help='update the drift monitoring aggregates in this directory')
+    parser.add_argument('--officer-index', help='update the officer-attribute index in this directory')
+    args = parser.parse_args()
+
+    recorder = StageRecorder(args.profile, args.profile_stages, args.profile_dir)
+    report = ValidationReport(args.invalid_rows)
+    run_pipeline(args.raw, args.output_dir, args.quiet, recorder, report, args.chunksize, args.monitor,
+                 args.officer_index)
+
+    print(recorder.summary())
+    for record in recorder.records:
+        if isinstance(record.get('profile'), str) and not args.profile_dir:
+            print('\n' + record['stage'] + '\n' + record['profile'])
+        for line in record.get('top_allocations', []):
+            print(record['stage'], line)
+    if args.report:
+        recorder.write_json(args.report)
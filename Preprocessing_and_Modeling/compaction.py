@@ -0,0 +1,55 @@
+import pandas as pd
+
+# Compact in-memory layout for the stops table, shared by the preprocessing pipeline,
+# the modelling notebook and the Streamlit app: low-cardinality strings become
+# categoricals, label-encoded 0/1 flags become booleans and counts/ages are downcast
+# to the smallest integer type that holds them.
+
+FLAG_COLUMNS = ['Officer_Gender', 'Driver_Gender', 'Driver_Ethnicity', 'Was_a_Search_Conducted', 'Racial_Match']
+CATEGORY_COLUMNS = ['Month_of_Stop', 'Reason_for_Stop', 'Officer_Race', 'Driver_Race', 'Result_of_Stop',
+                    'CMPD_Division', 'Outcome', 'Arrest', 'year']
+# Strings with at most this share of distinct values are stored as categoricals
+MAX_CATEGORY_RATIO = 0.5
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _compact_column(s, name):
+    if name in FLAG_COLUMNS and pd.api.types.is_integer_dtype(s) and s.isin([0, 1]).all():
+        return s.astype(bool)
+    if pd.api.types.is_bool_dtype(s) or isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    if pd.api.types.is_integer_dtype(s):
+        if len(s) and s.min() >= 0:
+            return pd.to_numeric(s, downcast='unsigned')
+        return pd.to_numeric(s, downcast='integer')
+    if s.dtype == object and (name in CATEGORY_COLUMNS or s.nunique() <= MAX_CATEGORY_RATIO * len(s)):
+        return s.astype('category')
+    return s
+
+
+def compact_stops(stops):
+    # Returns a compacted copy; values compare equal to the original column by column
+    return pd.DataFrame({name: _compact_column(stops[name], name) for name in stops.columns}, index=stops.index)
+
+
+def expand_flags(stops):
+    # Boolean flags back to the 0/1 integers of the exported csvs
+    flags = [c for c in stops.columns if pd.api.types.is_bool_dtype(stops[c])]
+    return stops.astype({c: 'uint8' for c in flags}) if flags else stops
+
+
+def widen_numeric(stops):
+    # Integer and flag columns back to int64, e.g. before SMOTENC: its neighbour differences
+    # wrap around in the downcast unsigned types (ages above 110, 255 years of service)
+    columns = [c for c in stops.columns
+               if pd.api.types.is_bool_dtype(stops[c]) or pd.api.types.is_integer_dtype(stops[c])]
+    return stops.astype({c: 'int64' for c in columns}) if columns else stops
+
+
+def compaction_summary(bytes_before, bytes_after):
+    return '{:.1f} MB -> {:.1f} MB ({:.1f} MB saved, {:.1f}x smaller)'.format(
+        bytes_before / 2 ** 20, bytes_after / 2 ** 20, (bytes_before - bytes_after) / 2 ** 20,
+        bytes_before / max(bytes_after, 1))
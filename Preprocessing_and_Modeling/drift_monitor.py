@@ -0,0 +1,234 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2 as chi2_distribution
+
+from compaction import FLAG_COLUMNS
+from evaluation import Report
+from significance import chi2_statistic
+from stop_labels import category_codes, month_labels
+
+# Temporal drift monitoring over Month_of_Stop.
+#
+# A DriftMonitor keeps two small tables in its directory:
+#   monthly_aggregates.csv - stops, searches and arrests per month and value of every
+#                            dimension in DIMENSIONS (race, division, reason, outcome, search);
+#   model_metrics.csv      - per model and month, the confusion counts of its predictions.
+# Both are only extended with months they do not have yet (update/record_model), so a new
+# month costs one pass over that month's stops. Drift statistics (PSI, chi-square between
+# periods, rate changes) and rolling model metrics are computed from these aggregates alone,
+# without rescanning the history.
+#
+#   python Preprocessing_and_Modeling/drift_monitor.py --monitor Monitoring --update Processed_Data/stops_2020_trimmed.csv
+#   python Preprocessing_and_Modeling/drift_monitor.py --monitor Monitoring --dimension Driver_Race --window 6
+
+DIMENSIONS = ['Driver_Race', 'CMPD_Division', 'Reason_for_Stop', 'Outcome', 'Was_a_Search_Conducted']
+MEASURES = ['stops', 'searches', 'arrests']
+AGGREGATES = 'monthly_aggregates.csv'
+MODEL_METRICS = 'model_metrics.csv'
+# Floor for empty bins in the population stability index
+PSI_EPSILON = 1e-4
+
+
+def _flags(stops):
+    searched = np.asarray(stops['Was_a_Search_Conducted']).astype(np.int64) == 1
+    arrested = np.asarray(stops['Arrest'] == 'Arrest')
+    return searched, arrested
+
+
+def _dimension_codes(column):
+    # Flags are coded 0/1 whether they arrive as the csv's ints or compact_stops' bools
+    if column.name in FLAG_COLUMNS:
+        return np.asarray(column).astype(np.int64), ['0', '1']
+    return category_codes(column)
+
+
+def monthly_aggregates(stops, dimensions=DIMENSIONS):
+    # One row per month, dimension and value with the MEASURES counts
+    months = month_labels(stops['Month_of_Stop'])
+    dated = np.asarray(months.codes) >= 0
+    if not dated.all():
+        stops, months = stops[dated], months[dated]
+    month_codes = np.asarray(months.codes, np.int64)
+    n_months = len(months.categories)
+    searched, arrested = _flags(stops)
+    frames = []
+    for dimension in dimensions:
+        codes, labels = _dimension_codes(stops[dimension])
+        cells = month_codes * len(labels) + codes
+        size = n_months * len(labels)
+        counts = {'stops': np.bincount(cells, minlength=size),
+                  'searches': np.bincount(cells, weights=searched, minlength=size).astype(np.int64),
+                  'arrests': np.bincount(cells, weights=arrested, minlength=size).astype(np.int64)}
+        frame = pd.DataFrame(counts)
+        frame.insert(0, 'value', np.tile(labels, n_months))
+        frame.insert(0, 'dimension', dimension)
+        frame.insert(0, 'month', np.repeat(np.asarray(months.categories), len(labels)))
+        frames.append(frame[frame['stops'] > 0])
+    return pd.concat(frames, ignore_index=True).sort_values(['month', 'dimension', 'value'], ignore_index=True)
+
+
+def psi(expected, actual, epsilon=PSI_EPSILON):
+    # Population stability index between two count vectors over the same bins
+    expected = np.asarray(expected, dtype=float)
+    actual = np.asarray(actual, dtype=float)
+    e = np.maximum(expected / max(expected.sum(), 1), epsilon)
+    a = np.maximum(actual / max(actual.sum(), 1), epsilon)
+    return float(((a - e) * np.log(a / e)).sum())
+
+
+def period_test(expected, actual):
+    # chi-square test of homogeneity between two periods' count vectors
+    table = np.vstack([expected, actual])
+    table = table[:, table.sum(axis=0) > 0]
+    statistic = float(chi2_statistic(table))
+    dof = max(table.shape[1] - 1, 1)
+    return statistic, float(chi2_distribution.sf(statistic, dof))
+
+
+class DriftMonitor:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.aggregates = self._read(AGGREGATES, ['month', 'dimension', 'value'] + MEASURES)
+        self.model_metrics = self._read(MODEL_METRICS, ['model', 'month', 'truth', 'prediction', 'count'])
+
+    def _read(self, name, columns):
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            return pd.read_csv(path, dtype={'month': str, 'value': str, 'truth': str, 'prediction': str})
+        return pd.DataFrame(columns=columns)
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.aggregates.to_csv(os.path.join(self.directory, AGGREGATES), index=False)
+        self.model_metrics.to_csv(os.path.join(self.directory, MODEL_METRICS), index=False)
+
+    @property
+    def months(self):
+        return sorted(self.aggregates['month'].unique())
+
+    def update(self, stops, refresh=()):
+        # Aggregates the months not stored yet (plus any in refresh); returns the months added
+        months = month_labels(stops['Month_of_Stop'])
+        wanted = [m for m in months.categories if m not in set(self.months) or m in set(refresh)]
+        if not wanted:
+            return []
+        new = monthly_aggregates(stops[np.isin(np.asarray(months), wanted)])
+        kept = self.aggregates[~self.aggregates['month'].isin(wanted)]
+        self.aggregates = pd.concat([kept, new], ignore_index=True).sort_values(
+            ['month', 'dimension', 'value'], ignore_index=True)
+        self._write()
+        return sorted(wanted)
+
+    def record_model(self, name, truth, predictions, month_of_stop, classes=None, refresh=()):
+        # Confusion counts per month of a model's predictions, for months not recorded yet
+        months = month_labels(pd.Series(month_of_stop))
+        recorded = set(self.model_metrics.loc[self.model_metrics['model'] == name, 'month'])
+        wanted = np.isin(np.asarray(months), [m for m in months.categories if m not in recorded or m in set(refresh)])
+        if not wanted.any():
+            return []
+        report = Report.from_predictions(np.asarray(truth)[wanted], np.asarray(predictions)[wanted], classes,
+                                         np.asarray(months)[wanted])
+        g, t, p = np.nonzero(report.counts)
+        new = pd.DataFrame({'model': name, 'month': np.asarray(report.groups)[g],
+                            'truth': np.asarray([str(c) for c in report.classes])[t],
+                            'prediction': np.asarray([str(c) for c in report.classes])[p],
+                            'count': report.counts[g, t, p]})
+        kept = self.model_metrics[~((self.model_metrics['model'] == name) &
+                                    self.model_metrics['month'].isin(new['month'].unique()))]
+        self.model_metrics = pd.concat([kept, new], ignore_index=True).sort_values(
+            ['model', 'month', 'truth', 'prediction'], ignore_index=True)
+        self._write()
+        return sorted(new['month'].unique())
+
+    def rolling_metrics(self, name, window=3):
+        # Accuracy and MCC of a model over each trailing window of recorded months
+        metrics = self.model_metrics[self.model_metrics['model'] == name]
+        if metrics.empty:
+            return pd.DataFrame(columns=['month', 'stops', 'accuracy', 'mcc', 'window'])
+        classes = sorted(set(metrics['truth']) | set(metrics['prediction']))
+        cube = metrics.pivot_table(index='month', columns=['truth', 'prediction'], values='count',
+                                   aggfunc='sum', fill_value=0)
+        cube = cube.reindex(columns=pd.MultiIndex.from_product([classes, classes]), fill_value=0)
+        counts = cube.to_numpy().reshape(len(cube), len(classes), len(classes))
+        rows = []
+        for i, month in enumerate(cube.index):
+            report = Report(counts[max(0, i - window + 1):i + 1].sum(axis=0, keepdims=True), classes, ['all'])
+            rows.append({'month': month, 'stops': int(report.counts.sum()), 'accuracy': report.accuracy,
+                         'mcc': report.mcc, 'window': min(window, i + 1)})
+        return pd.DataFrame(rows)
+
+    def distribution(self, dimension, months, measure='stops'):
+        data = self.aggregates[(self.aggregates['dimension'] == dimension) & self.aggregates['month'].isin(months)]
+        return data.groupby('value')[measure].sum()
+
+    def compare(self, baseline, current, dimensions=DIMENSIONS):
+        # PSI and chi-square of each dimension's distribution between two sets of months,
+        # with the search and arrest rates per value in both periods
+        rows = []
+        for dimension in dimensions:
+            before = self.distribution(dimension, baseline, MEASURES)
+            after = self.distribution(dimension, current, MEASURES)
+            both = before.reindex(before.index.union(after.index), fill_value=0)
+            after = after.reindex(both.index, fill_value=0)
+            statistic, p_value = period_test(both['stops'], after['stops'])
+            drift = psi(both['stops'], after['stops'])
+            for value in both.index:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    rows.append({
+                        'dimension': dimension, 'value': value, 'psi': drift, 'chi2': statistic, 'p_value': p_value,
+                        'share_before': both.at[value, 'stops'] / max(both['stops'].sum(), 1),
+                        'share_after': after.at[value, 'stops'] / max(after['stops'].sum(), 1),
+                        'search_rate_before': both.at[value, 'searches'] / both.at[value, 'stops'],
+                        'search_rate_after': after.at[value, 'searches'] / after.at[value, 'stops'],
+                        'arrest_rate_before': both.at[value, 'arrests'] / both.at[value, 'stops'],
+                        'arrest_rate_after': after.at[value, 'arrests'] / after.at[value, 'stops'],
+                    })
+        return pd.DataFrame(rows)
+
+    def monthly_drift(self, dimension, window=12):
+        # Each month against the `window` stored months before it
+        table = self.aggregates[self.aggregates['dimension'] == dimension].pivot_table(
+            index='month', columns='value', values='stops', aggfunc='sum', fill_value=0)
+        rows = []
+        for i in range(1, len(table)):
+            baseline = table.iloc[max(0, i - window):i].sum(axis=0)
+            current = table.iloc[i]
+            statistic, p_value = period_test(baseline, current)
+            rows.append({'month': table.index[i], 'baseline_months': min(window, i), 'stops': int(current.sum()),
+                         'psi': psi(baseline, current), 'chi2': statistic, 'p_value': p_value})
+        return pd.DataFrame(rows)
+
+
+def update_monitor(stops, directory, quiet=False):
+    # Pipeline stage: extends the monitor with the months of this run that it has not seen
+    added = DriftMonitor(directory).update(stops)
+    if not quiet:
+        print('monitor: {} new month(s) {}'.format(len(added), ', '.join(added)))
+    return stops
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monthly drift monitoring of the traffic stops.')
+    parser.add_argument('--monitor', default='Monitoring', help='directory of the monthly aggregates')
+    parser.add_argument('--update', nargs='*', default=[], help='processed stops csvs to add (new months only)')
+    parser.add_argument('--refresh', nargs='*', default=[], help='months (YYYY-MM) to re-aggregate')
+    parser.add_argument('--dimension', choices=DIMENSIONS, default='Driver_Race')
+    parser.add_argument('--window', type=int, default=12, help='months before each month used as its baseline')
+    parser.add_argument('--baseline', nargs=2, metavar=('FIRST', 'LAST'), help='compare this month range ...')
+    parser.add_argument('--current', nargs=2, metavar=('FIRST', 'LAST'), help='... with this one')
+    args = parser.parse_args()
+
+    monitor = DriftMonitor(args.monitor)
+    for path in args.update:
+        print(path, 'added months:', monitor.update(pd.read_csv(path), args.refresh))
+    with pd.option_context('display.max_rows', 200, 'display.width', 200):
+        print(monitor.monthly_drift(args.dimension, args.window))
+        if args.baseline and args.current:
+            months = monitor.months
+            baseline = [m for m in months if args.baseline[0] <= m <= args.baseline[1]]
+            current = [m for m in months if args.current[0] <= m <= args.current[1]]
+            print(monitor.compare(baseline, current))
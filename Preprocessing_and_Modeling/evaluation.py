@@ -0,0 +1,214 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Report engine for fitted classifiers: every split is predicted exactly once, in bounded
+# batches, and accuracy, MCC, per-class precision/recall/F1, the confusion matrix and the
+# fairness gaps between groups (e.g. Driver_Race) all come from one np.bincount over the
+# encoded (group, truth, prediction) triples. Confusion matrix plots are rendered to files
+# on a background thread instead of blocking on plt.show().
+
+BATCH_SIZE = 100_000
+MISSING_GROUP = 'Missing'
+
+
+def predict_batched(clf, X, batch_size=BATCH_SIZE):
+    # Same result as clf.predict(X) with the per-batch temporaries bounded by batch_size rows
+    if len(X) <= batch_size:
+        return np.asarray(clf.predict(X))
+    rows = X.iloc if isinstance(X, (pd.DataFrame, pd.Series)) else X
+    batches = [np.asarray(clf.predict(rows[start:start + batch_size])) for start in range(0, len(X), batch_size)]
+    return np.concatenate(batches)
+
+
+def _class_codes(values, classes):
+    codes = np.searchsorted(classes, values)
+    codes = np.clip(codes, 0, len(classes) - 1)
+    if not (classes[codes] == values).all():
+        raise ValueError('labels outside of the classifier classes {}'.format(list(classes)))
+    return codes
+
+
+def _group_codes(groups, n):
+    if groups is None:
+        return np.zeros(n, np.int64), ['all']
+    categorical = pd.Categorical(np.asarray(groups))
+    codes = categorical.codes.astype(np.int64)
+    labels = list(categorical.categories)
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append(MISSING_GROUP)
+    return codes, labels
+
+
+class Report:
+    # counts[g, t, p]: rows of group g with true class t predicted as class p
+
+    def __init__(self, counts, classes, groups, positive=None, name=None):
+        self.counts = counts
+        self.classes = list(classes)
+        self.groups = list(groups)
+        self.positive = self.classes.index(positive if positive is not None else self.classes[-1])
+        self.name = name
+
+    @classmethod
+    def from_predictions(cls, truth, predictions, classes=None, groups=None, positive=None, name=None):
+        truth, predictions = np.asarray(truth), np.asarray(predictions)
+        classes = np.unique(np.concatenate([truth, predictions])) if classes is None else np.asarray(classes)
+        t = _class_codes(truth, classes)
+        p = _class_codes(predictions, classes)
+        g, group_labels = _group_codes(groups, len(truth))
+        k = len(classes)
+        counts = np.bincount((g * k + t) * k + p, minlength=len(group_labels) * k * k)
+        return cls(counts.reshape(len(group_labels), k, k), classes, group_labels, positive, name)
+
+    @property
+    def confusion_matrix(self):
+        return self.counts.sum(axis=0)
+
+    @property
+    def accuracy(self):
+        cm = self.confusion_matrix
+        return np.trace(cm) / max(cm.sum(), 1)
+
+    @property
+    def mcc(self):
+        # multi-class Matthews correlation, as sklearn.metrics.matthews_corrcoef
+        cm = self.confusion_matrix.astype(float)
+        t_sum, p_sum, n = cm.sum(axis=1), cm.sum(axis=0), cm.sum()
+        cov_ytyp = np.trace(cm) * n - t_sum @ p_sum
+        cov_ypyp = n ** 2 - p_sum @ p_sum
+        cov_ytyt = n ** 2 - t_sum @ t_sum
+        if cov_ypyp * cov_ytyt == 0:
+            return 0.0
+        return cov_ytyp / np.sqrt(cov_ytyt * cov_ypyp)
+
+    def per_class(self):
+        cm = self.confusion_matrix.astype(float)
+        tp, support, predicted = np.diag(cm), cm.sum(axis=1), cm.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predicted > 0, tp / predicted, 0.0)
+            recall = np.where(support > 0, tp / support, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        return pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1,
+                             'support': support.astype(np.int64)}, index=pd.Index(self.classes, name='class'))
+
+    def fairness(self):
+        # Per group: share predicted positive, true/false positive rates and accuracy
+        pos = self.positive
+        counts = self.counts.astype(float)
+        n = counts.sum(axis=(1, 2))
+        actual_pos = counts[:, pos, :].sum(axis=1)
+        predicted_pos = counts[:, :, pos].sum(axis=1)
+        tp = counts[:, pos, pos]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            table = pd.DataFrame({
+                'stops': n.astype(np.int64),
+                'selection_rate': predicted_pos / n,
+                'tpr': tp / actual_pos,
+                'fpr': (predicted_pos - tp) / (n - actual_pos),
+                'accuracy': np.trace(counts, axis1=1, axis2=2) / n,
+            }, index=pd.Index(self.groups, name='group'))
+        return table
+
+    def fairness_gaps(self):
+        table = self.fairness().drop(MISSING_GROUP, errors='ignore')
+        table = table[table['stops'] > 0]
+        selection = table['selection_rate']
+        return {
+            'demographic_parity_gap': float(selection.max() - selection.min()),
+            'p_percent': float(selection.min() / selection.max()) if selection.max() > 0 else float('nan'),
+            'equal_opportunity_gap': float(table['tpr'].max() - table['tpr'].min()),
+            'fpr_gap': float(table['fpr'].max() - table['fpr'].min()),
+            'accuracy_gap': float(table['accuracy'].max() - table['accuracy'].min()),
+        }
+
+    def classification_report(self, digits=2):
+        # Same layout as sklearn.metrics.classification_report
+        per_class = self.per_class()
+        support = per_class['support']
+        names = [str(c) for c in self.classes]
+        width = max(max(len(n) for n in names), len('weighted avg'), digits)
+        head = '{:>{w}s} ' + ' {:>9}' * 4
+        row = '{:>{w}s} ' + ' {:>9.{d}f}' * 3 + ' {:>9}\n'
+        lines = [head.format('', 'precision', 'recall', 'f1-score', 'support', w=width) + '\n\n']
+        for name, (_, r) in zip(names, per_class.iterrows()):
+            lines.append(row.format(name, r['precision'], r['recall'], r['f1-score'], int(r['support']),
+                                    w=width, d=digits))
+        lines.append('\n')
+        total = int(support.sum())
+        lines.append(('{:>{w}s} ' + ' {:>9}' * 2 + ' {:>9.{d}f} {:>9}\n').format(
+            'accuracy', '', '', self.accuracy, total, w=width, d=digits))
+        metrics = per_class[['precision', 'recall', 'f1-score']]
+        weights = support / max(total, 1)
+        lines.append(row.format('macro avg', *metrics.mean(), total, w=width, d=digits))
+        lines.append(row.format('weighted avg', *metrics.mul(weights, axis=0).sum(), total, w=width, d=digits))
+        return ''.join(lines)
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'classes': [str(c) for c in self.classes], 'groups': [str(g) for g in self.groups],
+            'accuracy': float(self.accuracy), 'mcc': float(self.mcc),
+            'confusion_matrix': self.confusion_matrix.tolist(),
+            'per_class': self.per_class().reset_index().astype({'class': str}).to_dict(orient='records'),
+            'fairness': self.fairness().reset_index().astype({'group': str}).to_dict(orient='records'),
+            'fairness_gaps': self.fairness_gaps(),
+        }
+
+
+def evaluate(clf, X, T, groups=None, positive=None, name=None, batch_size=BATCH_SIZE):
+    # One batched prediction pass over the split
+    return Report.from_predictions(np.asarray(T), predict_batched(clf, X, batch_size), clf.classes_, groups,
+                                   positive, name)
+
+
+def _write_confusion_matrix(cm, classes, title, path):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from sklearn.metrics import ConfusionMatrixDisplay
+
+    # a pyplot-free figure, safe to render off the main thread
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=classes).plot(ax=ax)
+    ax.set_title(title)
+    figure.savefig(path)
+    return path
+
+
+class PlotWriter:
+    # Renders report figures to files on a background thread; call wait() (or use it as a
+    # context manager) before reading the files.
+
+    def __init__(self, directory, workers=1):
+        self.directory = directory
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+        os.makedirs(directory, exist_ok=True)
+
+    def confusion_matrix(self, report, title=None, filename=None):
+        title = title or report.name or 'confusion matrix'
+        filename = filename or '{}.png'.format(''.join(c if c.isalnum() or c in '-_' else '_' for c in title))
+        future = self.pool.submit(_write_confusion_matrix, report.confusion_matrix, report.classes, title,
+                                  os.path.join(self.directory, filename))
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        paths = [future.result() for future in self.futures]
+        self.futures = []
+        return paths
+
+    def close(self):
+        paths = self.wait()
+        self.pool.shutdown()
+        return paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
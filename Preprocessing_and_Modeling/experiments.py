@@ -0,0 +1,242 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy.stats import t as t_distribution
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold
+from sklearn.naive_bayes import GaussianNB
+
+import evaluation
+from compaction import widen_numeric
+from evaluation import evaluate
+from modeling_functions import (TARGETS, OH_Encode, prepare_contrast, prepare_normal, prepare_officer, return_race,
+                                upsample_process)
+from officer_index import add_officer_features, officer_group, service_bucket
+from shared_matrices import share_matrices, shared_directory
+
+# Cross-validated comparison of the "normal" and "contrast" datasources across models.
+#
+# Each datasource is encoded once for the whole table into shared float32/uint8 memory
+# maps (shared_matrices.py); workers attach to them and slice out their fold, so the
+# data is never pickled per task. Every (datasource, model, fold) result is stored as
+# <config hash>.json in the result store; the hash covers the data, the source of the
+# preparer and of the code between it and the metrics (code_version), the model's
+# parameters and the fold setup, so re-runs only fit what changed.
+#
+#   python Preprocessing_and_Modeling/experiments.py --data Processed_Data/stops_2020_trimmed.csv
+
+PREPARERS = {'normal': prepare_normal, 'contrast': prepare_contrast, 'officer': prepare_officer}
+COMPARED = ('normal', 'contrast')
+MODELS = {
+    'Logistic Reg': LogisticRegression(max_iter=1000),
+    'GradientBoostingClassifier': GradientBoostingClassifier(),
+    'GaussianNB': GaussianNB(),
+    'RandomForest': RandomForestClassifier(),
+}
+METRICS = ['train_accuracy', 'test_accuracy', 'mcc', 'precision', 'recall', 'f1', 'fit_seconds']
+# Range of each metric; the confidence intervals are clipped to it
+BOUNDS = {'mcc': (-1, 1), 'fit_seconds': (0, None)}
+# Class scored as positive for targets that are not 0/1 encoded; it gets the highest code
+POSITIVE = {'Arrest': 'Arrest'}
+STORE = 'Experiment_Results'
+FOLDS = 5
+SEED = 101
+
+
+def data_fingerprint(data):
+    return hashlib.sha1(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def config_hash(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def model_config(model):
+    return {'class': type(model).__module__ + '.' + type(model).__name__,
+            'params': {k: repr(v) for k, v in model.get_params(deep=True).items()}}
+
+
+class ResultStore:
+    # One json file per config hash; written by the parent process only
+
+    def __init__(self, path=STORE):
+        self.path = path
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, key):
+        if self.path is None or not os.path.exists(self._file(key)):
+            return None
+        with open(self._file(key)) as f:
+            return json.load(f)
+
+    def put(self, key, record):
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(key), 'w') as f:
+            json.dump(record, f, indent=2, default=str)
+
+
+def encode_target(T, target):
+    # 0/1 flags are used as they are; string targets (Arrest) become label codes
+    values = np.asarray(T)
+    if values.dtype == bool or np.issubdtype(values.dtype, np.integer):
+        return T
+    classes = sorted(set(values) - {POSITIVE.get(target)})
+    classes += [POSITIVE[target]] if POSITIVE.get(target) in set(values) else []
+    return pd.Series(pd.Categorical(values, categories=classes).codes.astype(np.int64), name=T.name)
+
+
+def encode_folds(data, preparer, target, folds=FOLDS, seed=SEED, upsample=False, path=None):
+    # One dict per fold with the shared X/T maps and the fold's row indices. The table is
+    # encoded once; with upsample the training part of each fold is resampled with SMOTENC,
+    # re-encoded onto the same columns and shared as X_train_<fold>/T_train_<fold>.
+    data = data.reset_index(drop=True)
+    X, T = PREPARERS[preparer](data, target)
+    T = encode_target(T, target)
+    matrices = {'X': X, 'T': T}
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    splits = list(splitter.split(np.zeros(len(T)), T))
+    for fold, (train_index, _) in enumerate(splits if upsample else []):
+        resampled = upsample_process(data.iloc[train_index].reset_index(drop=True), target)
+        X_train, T_train = PREPARERS[preparer](resampled, target)
+        matrices['X_train_{}'.format(fold)] = X_train.reindex(columns=X.columns, fill_value=0)
+        matrices['T_train_{}'.format(fold)] = encode_target(T_train, target)
+    shared = share_matrices(matrices, path, frames=False)
+    encoded = []
+    for fold, (train_index, test_index) in enumerate(splits):
+        encoded.append({'X': shared['X'], 'T': shared['T'], 'train': train_index, 'test': test_index,
+                        'X_train': shared.get('X_train_{}'.format(fold)),
+                        'T_train': shared.get('T_train_{}'.format(fold))})
+    return encoded, list(X.columns)
+
+
+def fold_arrays(fold):
+    # Sliced in the worker, from the memory maps it attached to
+    if fold['X_train'] is not None:
+        X_train, T_train = fold['X_train'], fold['T_train']
+    else:
+        X_train, T_train = fold['X'][fold['train']], fold['T'][fold['train']]
+    return X_train, T_train, fold['X'][fold['test']], fold['T'][fold['test']]
+
+
+def fit_fold(model, fold):
+    X_train, T_train, X_test, T_test = fold_arrays(fold)
+    start = time.perf_counter()
+    clf = clone(model).fit(X_train, T_train)
+    fit_seconds = time.perf_counter() - start
+    train_report, test_report = evaluate(clf, X_train, T_train), evaluate(clf, X_test, T_test)
+    # binary targets score the positive class, multi-class targets the macro average
+    per_class = test_report.per_class()
+    scores = per_class.iloc[test_report.positive] if len(per_class) == 2 else per_class.mean()
+    return {
+        'train_accuracy': train_report.accuracy,
+        'test_accuracy': test_report.accuracy,
+        'mcc': test_report.mcc,
+        'precision': scores['precision'],
+        'recall': scores['recall'],
+        'f1': scores['f1-score'],
+        'fit_seconds': fit_seconds,
+    }
+
+
+def code_version(preparer):
+    # Hash of the source behind a stored result: the preparer and its encoding helpers,
+    # the resampling, the target encoding, the fold fit and the evaluation module
+    parts = [PREPARERS[preparer], OH_Encode, return_race, add_officer_features, officer_group, service_bucket,
+             upsample_process, widen_numeric, encode_target, encode_folds, fold_arrays, fit_fold, evaluation]
+    return hashlib.sha1(''.join(inspect.getsource(part) for part in parts).encode()).hexdigest()
+
+
+def run_experiments(data, preparers=COMPARED, models=None, target='Was_a_Search_Conducted',
+                    folds=FOLDS, seed=SEED, upsample=False, n_jobs=-1, store=STORE, verbose=0):
+    # One row per datasource, model and fold; cached results are reused
+    models = MODELS if models is None else models
+    store = store if isinstance(store, ResultStore) else ResultStore(store)
+    fingerprint = data_fingerprint(data)
+
+    rows, tasks, shared_dirs = [], [], []
+    for preparer in preparers:
+        base = {'data': fingerprint, 'target': target, 'folds': folds, 'seed': seed, 'upsample': upsample,
+                'preparer': preparer, 'code': code_version(preparer)}
+        keys = {(name, fold): config_hash(dict(base, model=model_config(model), fold=fold))
+                for name, model in models.items() for fold in range(folds)}
+        cached = {k: store.get(key) for k, key in keys.items()}
+        if all(record is not None for record in cached.values()):
+            rows += list(cached.values())
+            continue
+        shared_dirs.append(shared_directory())
+        encoded, _ = encode_folds(data, preparer, target, folds, seed, upsample, shared_dirs[-1])
+        for (name, fold), record in cached.items():
+            if record is not None:
+                rows.append(record)
+            else:
+                tasks.append((keys[name, fold], {'preparer': preparer, 'model': name, 'fold': fold},
+                              models[name], encoded[fold]))
+
+    try:
+        results = Parallel(n_jobs=n_jobs, verbose=verbose)(
+            delayed(fit_fold)(model, fold) for _, _, model, fold in tasks)
+    finally:
+        for path in shared_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+    for (key, labels, _, _), metrics in zip(tasks, results):
+        record = dict(labels, target=target, key=key, **metrics)
+        store.put(key, record)
+        rows.append(record)
+
+    order = {(p, m): i for i, (p, m) in enumerate((p, m) for p in preparers for m in models)}
+    rows.sort(key=lambda r: (order[r['preparer'], r['model']], r['fold']))
+    return pd.DataFrame(rows)
+
+
+def compare_results(results, confidence=0.95, metrics=METRICS):
+    # Mean of every metric across folds with a t-interval per datasource and model,
+    # clipped to the metric's range (BOUNDS)
+    grouped = results.groupby(['preparer', 'model'], sort=False)[metrics]
+    mean, std, n = grouped.mean(), grouped.std(ddof=1), grouped.size()
+    half = std.mul(t_distribution.ppf((1 + confidence) / 2, n - 1) / np.sqrt(n), axis=0)
+    low = pd.DataFrame({m: (mean[m] - half[m]).clip(*BOUNDS.get(m, (0, 1))) for m in metrics})
+    high = pd.DataFrame({m: (mean[m] + half[m]).clip(*BOUNDS.get(m, (0, 1))) for m in metrics})
+    table = pd.concat({'mean': mean, 'low': low, 'high': high}, axis=1)
+    table.columns = ['{}_{}'.format(metric, stat) for stat, metric in table.columns]
+    table = table[['{}_{}'.format(m, s) for m in metrics for s in ('mean', 'low', 'high')]]
+    return table.assign(folds=n)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cross-validated datasource x model comparison.')
+    parser.add_argument('--data', default='Processed_Data/stops_2020_trimmed.csv')
+    parser.add_argument('--target', choices=TARGETS, default='Was_a_Search_Conducted')
+    parser.add_argument('--preparers', nargs='+', choices=list(PREPARERS), default=list(COMPARED))
+    parser.add_argument('--models', nargs='+', choices=list(MODELS), default=list(MODELS))
+    parser.add_argument('--folds', type=int, default=FOLDS)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--upsample', action='store_true', help='SMOTENC on the training part of each fold')
+    parser.add_argument('--jobs', type=int, default=-1)
+    parser.add_argument('--store', default=STORE, help='result cache directory')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--output', help='write the comparison table to this csv')
+    args = parser.parse_args()
+
+    from compaction import compact_stops
+    data = compact_stops(pd.read_csv(args.data))
+    results = run_experiments(data, args.preparers, {name: MODELS[name] for name in args.models}, args.target,
+                              args.folds, args.seed, args.upsample, args.jobs, args.store)
+    table = compare_results(results, args.confidence)
+    with pd.option_context('display.max_columns', 50, 'display.width', 250):
+        print(table)
+    if args.output:
+        table.to_csv(args.output)
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from sklearn.metrics import ConfusionMatrixDisplay
+from sklearn.preprocessing import OneHotEncoder
+
+from compaction import widen_numeric
+from evaluation import BATCH_SIZE, evaluate
+from officer_index import add_officer_features
+
+# Helpers shared by the modelling notebook (modelling_contrast_and_fairness.py)
+# and the benchmark suite.
+
+TARGETS = ['Was_a_Search_Conducted', 'Arrest']
+CAT_COLS = ['Reason_for_Stop', 'Officer_Race', 'Officer_Gender', 'Driver_Race',
+            'Driver_Ethnicity', 'Driver_Gender', 'CMPD_Division', 'Racial_Match']
+
+
+def upsample_process(data, desired_col):
+  # Drops uninteresting columns
+  # Upsamples appropriately and returns training data, upsampled.
+  from imblearn.over_sampling import SMOTENC
+
+  # compacted frames (compaction.py) hold uint8 ages/years that SMOTENC would wrap around
+  data_colsdropped = widen_numeric(data.drop(['Unnamed: 0', 'Month_of_Stop', 'Result_of_Stop', 'Outcome'], axis = 1))
+  X = data_colsdropped.drop(TARGETS, axis = 1)
+  Y = data_colsdropped[TARGETS]
+  cat_cols = list(np.flatnonzero(X.columns.isin(CAT_COLS)))
+  su = SMOTENC(categorical_features=cat_cols, random_state=42)
+  try:
+    X_upsample, Y_upsample = su.fit_resample(X, Y[desired_col])
+  except KeyError:
+    print('Could not find that column in data!')
+    return None
+  print('X resample shape: {}'.format(X_upsample.shape))
+  print('Y resample shape: {}'.format(Y_upsample.shape))
+  return pd.concat([X_upsample, Y_upsample], axis = 1)
+
+
+def OH_Encode(df, columns):
+  OH = OneHotEncoder(dtype=np.uint8)
+
+  new = pd.DataFrame(OH.fit_transform(df[columns]).toarray())
+  cols = []
+  for index, val in enumerate(columns):
+    cols += [val + '_' + x.strip() for x in list(OH.categories_[index])]
+
+  new.columns = cols
+
+  return pd.concat([df, new], axis = 1).drop(columns, axis = 1)
+
+
+def prepare_contrast(data, desired_col):
+  contrast_start = data.copy()
+  contrast_mid = OH_Encode(contrast_start, ['Reason_for_Stop', 'CMPD_Division'])
+
+  try:
+    contrast_mid = contrast_mid.drop(['Unnamed: 0', 'Month_of_Stop', 'Result_of_Stop', 'Outcome'], axis = 1)
+  except:
+    pass
+
+  contrast_mid['Gender_Match'] = (contrast_mid['Officer_Gender'] == contrast_mid['Driver_Gender']).astype('int')
+  contrast_final = contrast_mid.drop(['Officer_Race', 'Driver_Race',  'Officer_Gender', 'Driver_Gender'], axis = 1)
+  contrast_X = contrast_final.drop(TARGETS, axis = 1, errors = 'ignore')
+  contrast_T = contrast_final[desired_col]
+  return contrast_X, contrast_T
+
+
+def return_race(s):
+  race_dict = {'Black':1, 'White':0, 'Other/Unknown':1, 'Asian':1, 'Native American':1}
+  return race_dict[s]
+
+
+def prepare_normal(data, desired_col):
+  normal_data = OH_Encode(data, ['Reason_for_Stop', 'CMPD_Division', 'Officer_Race'])
+
+  # Tries to drop columns if it can.
+  try:
+    normal_data = normal_data.drop(['Racial_Match'], axis = 1)
+    normal_data = normal_data.drop(['Unnamed: 0', 'Month_of_Stop', 'Result_of_Stop', 'Outcome'], axis = 1)
+  except:
+    pass
+
+  # Transform Values for Arrest, Race, and Searches.
+  #normal_data['Arrest'] = [1 if x == 'Arrest' else 0 for x in normal_data['Arrest']]
+  normal_data['Driver_Race'] = normal_data['Driver_Race'].map(return_race)
+  # normal_data['Was_a_Search_Conducted'] = [1 if x == 0 else 0 for x in normal_data['Was_a_Search_Conducted']]
+
+  # Subset to desired columns.
+  final_X = normal_data.drop(TARGETS, axis = 1, errors = 'ignore')
+  final_T = normal_data[desired_col]
+  return final_X, final_T
+
+
+def prepare_officer(data, desired_col):
+  # prepare_normal with the officer attributes of officer_index.py: the years-of-service
+  # bucket instead of raw years and one race/gender group instead of two columns
+  officer_data = add_officer_features(data).drop(['Officer_Race', 'Officer_Gender', 'Officer_Years_of_Service'], axis = 1)
+  officer_data = OH_Encode(officer_data, ['Reason_for_Stop', 'CMPD_Division', 'Officer_Group'])
+
+  try:
+    officer_data = officer_data.drop(['Racial_Match'], axis = 1)
+    officer_data = officer_data.drop(['Unnamed: 0', 'Month_of_Stop', 'Result_of_Stop', 'Outcome'], axis = 1)
+  except:
+    pass
+
+  officer_data['Driver_Race'] = officer_data['Driver_Race'].map(return_race)
+
+  final_X = officer_data.drop(TARGETS, axis = 1, errors = 'ignore')
+  final_T = officer_data[desired_col]
+  return final_X, final_T
+
+
+def train_eval(clf, X_train, t_train, X_test, t_test, info, groups=None, plots=None, batch_size=BATCH_SIZE):
+    # Fits, then predicts each split once (in batches) and derives every metric from the
+    # confusion counts (see evaluation.py). groups (e.g. test['Driver_Race']) adds the
+    # fairness gaps; with a PlotWriter the confusion matrix is written to a file in the
+    # background instead of shown.
+    clf.fit(X_train, t_train)
+
+    train_report = evaluate(clf, X_train, t_train, name=info['clf'], batch_size=batch_size)
+    test_report = evaluate(clf, X_test, t_test, groups, name=info['clf'], batch_size=batch_size)
+
+    print("{}> Train Accuracy: {}, Test Accuracy: {}".format(info['clf'], train_report.accuracy, test_report.accuracy))
+    print("{}> MCC is {}".format(info['clf'], test_report.mcc))
+    print(test_report.classification_report())
+    if groups is not None:
+        print("{}> Fairness gaps: {}".format(info['clf'], test_report.fairness_gaps()))
+
+    if plots is not None:
+        plots.confusion_matrix(test_report, info['clf'])
+    else:
+        disp = ConfusionMatrixDisplay(confusion_matrix=test_report.confusion_matrix, display_labels=clf.classes_)
+        disp.plot()
+        plt.title(info['clf'])
+        plt.show()
+    return test_report
+
+    # Residual Plot
+    #residuals = t_test - test_pred
+    #plt.scatter(X_test[col], residuals)
+    #plt.title('Residuals for {} for {}'.format(name, col))
+    #plt.show()
@@ -23,33 +23,17 @@ from sklearn.preprocessing import OneHotEncoder
 
 """## Loading Data"""
 
-train = pd.read_csv('Processed_Data/stops_2020_train.csv')
-test = pd.read_csv('Processed_Data/stops_2020_test.csv')
+from compaction import compact_stops
+
+# categoricals / booleans / small ints instead of object strings and int64
+train = compact_stops(pd.read_csv('Processed_Data/stops_2020_train.csv'))
+test = compact_stops(pd.read_csv('Processed_Data/stops_2020_test.csv'))
 
 train['Was_a_Search_Conducted'].value_counts()
 
 """## Upsampling"""
 
-def upsample_process(data, desired_col):
-  # Drops uninteresting columns
-  # Upsamples appropriately and returns training data, upsampled.
-  data_colsdropped = data.drop(['Unnamed: 0', 'Month_of_Stop', 'Result_of_Stop', 'Outcome'], axis = 1)
-  X = data_colsdropped[(data_colsdropped.columns[data_colsdropped.columns != 'Was_a_Search_Conducted']) \
-                       & (data_colsdropped.columns[data_colsdropped.columns != 'Arrest'])]
-  Y = data_colsdropped[['Was_a_Search_Conducted', 'Arrest']]
-  cat_cols = X.columns.isin(['Reason_for_Stop', 'Officer_Race',\
-                             'Officer_Gender', 'Driver_Race',\
-                             'Driver_Ethnicity','Driver_Gender',\
-                             'CMPD_Division', 'Racial_Match'])
-  su = SMOTENC(categorical_features=cat_cols, random_state=42)
-  try:
-    X_upsample, Y_upsample = su.fit_resample(X, Y[desired_col])
-  except KeyError:
-    print('Could not find that column in data!')
-    return _,_
-  print('X resample shape: {}'.format(X_upsample.shape))
-  print('Y resample shape: {}'.format(Y_upsample.shape))
-  return pd.concat([X_upsample, Y_upsample], axis = 1)
+from modeling_functions import upsample_process
 
 train_upsample = upsample_process(train, 'Was_a_Search_Conducted')
 
@@ -61,32 +45,7 @@ train_upsample.head()
 
 """## Creating Contrast Datasource"""
 
-def OH_Encode(df, columns):
-  OH = OneHotEncoder()
-
-  new = pd.DataFrame(OH.fit_transform(df[columns]).toarray())
-  cols = []
-  for index, val in enumerate(columns):
-    cols += [val + '_' + x.strip() for x in list(OH.categories_[index])]
-
-  new.columns = cols
-
-  return pd.concat([df, new], axis = 1).drop(columns, axis = 1)
-
-def prepare_contrast(data, desired_col):
-  contrast_start = data.copy()
-  contrast_mid = OH_Encode(contrast_start, ['Reason_for_Stop', 'CMPD_Division'])
-
-  try:
-    contrast_mid = contrast_mid.drop(['Unnamed: 0', 'Month_of_Stop', 'Result_of_Stop', 'Outcome', 'Arrest'], axis = 1)
-  except:
-    pass
-  
-  contrast_mid['Gender_Match'] = (contrast_mid['Officer_Gender'] == contrast_mid['Driver_Gender']).astype('int')
-  contrast_final = contrast_mid.drop(['Officer_Race', 'Driver_Race',  'Officer_Gender', 'Driver_Gender'], axis = 1)
-  contrast_X = contrast_final[(contrast_final.columns[contrast_final.columns != 'Was_a_Search_Conducted']) & (contrast_final.columns[contrast_final.columns != 'Arrest'])]
-  contrast_T = contrast_final[desired_col]
-  return contrast_X, contrast_T
+from modeling_functions import OH_Encode, prepare_contrast
 
 X_train_contrast, T_train_contrast = prepare_contrast(train_upsample, 'Was_a_Search_Conducted')
 
@@ -98,67 +57,34 @@ X_test_contrast.head()
 
 """
 
-def return_race(s):
-  race_dict = {'Black':1, 'White':0, 'Other/Unknown':1, 'Asian':1, 'Native American':1}
-  return race_dict[s]
-
-def prepare_normal(data, desired_col):
-  normal_data = OH_Encode(data, ['Reason_for_Stop', 'CMPD_Division', 'Officer_Race'])
-
-  # Tries to drop columns if it can.
-  try:
-    normal_data = normal_data.drop(['Racial_Match'], axis = 1)
-    normal_data = normal_data.drop(['Unnamed: 0', 'Month_of_Stop', 'Result_of_Stop', 'Outcome'], axis = 1)
-  except:
-    pass
-
-  # Transform Values for Arrest, Race, and Searches.
-  #normal_data['Arrest'] = [1 if x == 'Arrest' else 0 for x in normal_data['Arrest']]
-  normal_data['Driver_Race'] = normal_data['Driver_Race'].map(return_race)
-  # normal_data['Was_a_Search_Conducted'] = [1 if x == 0 else 0 for x in normal_data['Was_a_Search_Conducted']]
-
-  # Subset to desired columns.
-  final_X = normal_data[(normal_data.columns[normal_data.columns != 'Was_a_Search_Conducted']) & (normal_data.columns[normal_data.columns != 'Arrest'])]
-  final_T = normal_data[desired_col]
-  return final_X, final_T
+from modeling_functions import return_race, prepare_normal
 
 X_train, T_train = prepare_normal(train_upsample, 'Was_a_Search_Conducted')
 X_test, T_test = prepare_normal(test, 'Was_a_Search_Conducted')
 
+# float32/uint8 copies in shared memory for the parallel searches below (GridSearchCV, SFS,
+# the fairness sweep); workers attach to the same pages instead of each unpickling a copy.
+# The files are removed with release_matrices below, or when the kernel exits.
+from shared_matrices import release_matrices, share_matrices
+shared = share_matrices({'X_train': X_train, 'T_train': T_train, 'X_test': X_test, 'T_test': T_test})
+
 """## Train and Eval Functions"""
 
-def train_eval(clf, X_train, t_train, X_test, t_test, info):
-    clf.fit(X_train, t_train)
-
-    train_score = clf.score(X_train, t_train)
-    test_score = clf.score(X_test, t_test)
-
-    print("{}> Train Accuracy: {}, Test Accuracy: {}".format(info['clf'], train_score, test_score))
-    test_pred = clf.predict(X_test)
-    
-    print("{}> MCC is {}".format(info['clf'], matthews_corrcoef(t_test, test_pred)))
-    print(classification_report(t_test, test_pred))
-    
-    cm = confusion_matrix(t_test, test_pred, labels=clf.classes_)
-    disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=clf.classes_)
-    disp.plot()
-    plt.title(info['clf'])
-    plt.show()
-    
-    # Residual Plot
-    #residuals = t_test - test_pred
-    #plt.scatter(X_test[col], residuals)
-    #plt.title('Residuals for {} for {}'.format(name, col))
-    #plt.show()
+from modeling_functions import train_eval
 
 models = [LogisticRegression(max_iter = 500), GradientBoostingClassifier(), KNeighborsClassifier(), GaussianNB(), RandomForestClassifier(), DemographicParityClassifier(sensitive_cols="Driver_Race", covariance_threshold=0.80)]
 names = ["Logistic Reg", "GradientBoostingClassifier", 'KNeighborsClassifier', 'GaussianNB', 'RandomForest', 'DemographicParityClassifier']
 
 """## Baseline Classifier Performance - Upsampled Data"""
 
+from evaluation import PlotWriter
+
+# confusion matrices are written to Model_Reports in the background; fairness gaps by driver race
+plots = PlotWriter('Model_Reports')
 for name, model in zip(names, models):
     info = {'clf':name, 'data':'Charlotte Policing'}
-    train_eval(model, X_train, T_train, X_test, T_test, info)
+    train_eval(model, X_train, T_train, X_test, T_test, info, groups=test['Driver_Race'], plots=plots)
+plots.wait()
 
 """## Baseline Classifier Performance - Contrast
 
@@ -169,7 +95,55 @@ names = ["Logistic Reg", "GradientBoostingClassifier", 'GaussianNB']
 
 for name, model in zip(names, models):
     info = {'clf':name, 'data':'Charlotte Policing'}
-    train_eval(model, X_train, T_train, X_test, T_test, info)
+    train_eval(model, X_train_contrast, T_train_contrast, X_test_contrast, T_test_contrast, info)
+
+"""## Cross-Validated Comparison - Normal vs. Contrast
+The single split above gives one number per model. `experiments.py` runs both datasources through the same stratified folds in parallel and reports every metric with a confidence interval. Results are cached in Experiment_Results by config hash, so re-running only fits new or changed models.
+"""
+
+from experiments import run_experiments, compare_results
+
+cv_results = run_experiments(train, preparers=['normal', 'contrast'], target='Was_a_Search_Conducted', folds=5, upsample=True)
+compare_results(cv_results)
+
+"""## Search, Arrest and Outcome Models
+The classifiers above only predict whether a search was conducted. `multi_target.py` encodes the features once and trains the search, arrest and 3-class outcome (Arrest / Citation / Warning/No Action) models on the same matrix in parallel, weighting classes per target instead of upsampling for each one.
+"""
+
+from multi_target import train_targets
+
+target_summary, target_results = train_targets(train, test, targets=['search', 'arrest', 'outcome'], plots=plots)
+plots.wait()
+target_summary
+
+print(target_results['outcome', 'Logistic Reg']['report'].classification_report())
+
+"""## Drift Across Months
+The data grows monthly. `drift_monitor.py` keeps monthly counts by race, division, reason, outcome and search in Monitoring, adding only months it has not seen, and measures drift (PSI, chi2) of each month against the months before it. Model predictions recorded per month give rolling accuracy and MCC.
+"""
+
+from drift_monitor import DriftMonitor
+
+monitor = DriftMonitor('Monitoring')
+monitor.update(pd.concat([train, test]))
+monitor.monthly_drift('Driver_Race', window=6)
+
+search_model = LogisticRegression(max_iter=1000).fit(X_train, T_train)
+monitor.record_model('search - Logistic Reg', T_test, search_model.predict(X_test), test['Month_of_Stop'])
+monitor.rolling_metrics('search - Logistic Reg', window=3)
+
+"""## Officer Attributes
+`officer_index.py` buckets years of service (0, 1-4, 5-8, ..., 37+) and groups officers by race and gender. The same index feeds the dashboard's years-of-service chart and the "officer" preparer, which replaces the raw officer columns with these attributes.
+"""
+
+from officer_index import OfficerIndex
+
+officer_index = OfficerIndex('Officer_Index')
+officer_index.update(pd.concat([train, test]))
+officer_index.officer_rates(['Officer_Service_Bucket', 'Officer_Race'])
+
+officer_results = run_experiments(train, preparers=['normal', 'officer'], target='Was_a_Search_Conducted', folds=5)
+compare_results(officer_results)
 
 """## Fine Tuning Best Normal Classifiers (Include and Exclude Race)
 
@@ -331,10 +305,13 @@ from sklearn.feature_selection import SequentialFeatureSelector as SFS
 # This is based on the cross-validation score of an unfitted estimator (LogReg)
 sfs = SFS(LogisticRegression(),
            n_features_to_select=0.8,
-           cv=3)
+           cv=3,
+           n_jobs=-1)
+x_1 = share_matrices({'x_1': x_1}, frames=False)['x_1']
 
 #Use SFS to select the top features (KNN and GB take too long, drop to Logreg)
 sfs.fit(x_1, T_train)
+release_matrices({'x_1': x_1})
 
 # See selected variables (Driver_Race seems to be a relevant variable)
 X_train.columns[sfs.get_support()]
@@ -381,8 +358,8 @@ params_grid = [{
                 }
               ]
 
-grid = GridSearchCV(pipe, params_grid,cv=3,scoring='recall')
-_ = grid.fit(X_train,T_train)
+grid = GridSearchCV(pipe, params_grid,cv=3,scoring='recall',n_jobs=-1)
+_ = grid.fit(shared['X_train'],shared['T_train'])
 
 grid.best_params_
 
@@ -430,8 +407,8 @@ params_grid_rand = [{
                 }
               ]
 
-grid_rand = RandomizedSearchCV(pipe_rand, params_grid_rand,cv=3,scoring='recall',n_iter=250)
-_ = grid_rand.fit(X_train,T_train)
+grid_rand = RandomizedSearchCV(pipe_rand, params_grid_rand,cv=3,scoring='recall',n_iter=250,n_jobs=-1)
+_ = grid_rand.fit(shared['X_train'],shared['T_train'])
 
 grid_rand.best_params_
 
@@ -468,6 +445,15 @@ from sklego.metrics import p_percent_score
 p_score = p_percent_score('Driver_Race')(GB, X_train, T_train)
 p_score
 
+"""## Permutation and Bootstrap Tests for Race Disparities
+The chi2 scores and the p% score above are single numbers. `significance.py` puts permutation p-values and bootstrap intervals on the race x arrest and race x search disparities, overall and per division.
+"""
+
+from significance import disparity_test
+disparity_test(train, outcome='Arrest', by=['CMPD_Division'], replicates=10000, n_jobs=4)
+
+disparity_test(train, outcome='Was_a_Search_Conducted', by=['Officer_Race'], replicates=10000)
+
 """## Drawing Some P% Graphs with FairClassifier
 Once we have finished hyper-tuning some models (excluding Fairness Classifiers) we can draw these graphs for the presentation. Essentially, these show the trade-off between different covariance thresholds and performance.
 """
@@ -488,15 +474,19 @@ fair_classifier = GridSearchCV(estimator=DemographicParityClassifier(sensitive_c
                                return_train_score=True,
                                scoring={"p_percent_score": p_percent_score('Driver_Race'),
                                         "accuracy_score": make_scorer(accuracy_score),
-                                        "recall_score":make_scorer(recall_score)})
+                                        "recall_score":make_scorer(recall_score)},
+                               n_jobs=-1)
 
 with warnings.catch_warnings():
     warnings.simplefilter("ignore")
-    fair_classifier.fit(X_train, T_train);
+    fair_classifier.fit(shared['X_train'], shared['T_train']);
 
     pltr = (pd.DataFrame(fair_classifier.cv_results_)
             .set_index("param_estimator__covariance_threshold"))
 
+# last use of the shared matrices: free the shared memory
+release_matrices(shared)
+
 logreg = LogisticRegression(max_iter = 1000)
 # "col" not needed here since T_train is initialized with T_train, which only has 1 column. Thus, T_train is a Series.
 logreg.fit(X_train, T_train)
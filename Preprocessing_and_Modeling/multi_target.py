@@ -0,0 +1,149 @@
+import argparse
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.utils.class_weight import compute_class_weight
+from sklearn.utils.validation import has_fit_parameter
+
+from evaluation import Report, predict_batched
+from experiments import MODELS, PREPARERS
+from shared_matrices import share_matrices, shared_directory
+
+# Trains the search, arrest and 3-class outcome models against one encoded feature matrix.
+#
+# Features are encoded once (without any target or outcome-derived column) and shared with
+# the workers through memory maps (shared_matrices.py) together with the uint8 codes of
+# every target. Each (target, model) pair is fitted in parallel; class imbalance is handled
+# per target with balanced sample weights instead of one SMOTENC run per target.
+#
+#   python Preprocessing_and_Modeling/multi_target.py --train Processed_Data/stops_2020_train.csv \
+#       --test Processed_Data/stops_2020_test.csv
+
+TARGET_COLUMNS = {'search': 'Was_a_Search_Conducted', 'arrest': 'Arrest', 'outcome': 'Outcome'}
+# Class reported as "positive" in the fairness gaps
+POSITIVE = {'search': 1, 'arrest': 'Arrest', 'outcome': 'Arrest'}
+OUTCOME_COLUMNS = ['Was_a_Search_Conducted', 'Arrest', 'Outcome', 'Result_of_Stop']
+WEIGHTINGS = ('balanced', 'none')
+
+
+def prepare_features(data, preparer='normal'):
+    # The preparer's encoding with every target and outcome-derived column removed
+    X, _ = PREPARERS[preparer](data.reset_index(drop=True), 'Was_a_Search_Conducted')
+    return X.drop(OUTCOME_COLUMNS, axis=1, errors='ignore')
+
+
+def encode_target(column, classes=None):
+    # uint8 codes into the sorted class labels
+    classes = np.unique(np.asarray(column)) if classes is None else np.asarray(classes)
+    codes = np.searchsorted(classes, np.asarray(column))
+    if not (classes[np.clip(codes, 0, len(classes) - 1)] == np.asarray(column)).all():
+        raise ValueError('{} has values outside {}'.format(getattr(column, 'name', 'target'), list(classes)))
+    return codes.astype(np.uint8), classes
+
+
+def sample_weights(codes, weighting='balanced'):
+    if weighting == 'none':
+        return None
+    present = np.unique(codes)
+    weights = np.zeros(int(codes.max()) + 1)
+    weights[present] = compute_class_weight('balanced', classes=present, y=codes)
+    return weights[codes]
+
+
+def fit_target(model, target, shared, classes, group_labels, weighting='balanced', keep_model=False):
+    X_train, X_test = shared['X_train'], shared['X_test']
+    T_train, T_test = shared['T_train_' + target], shared['T_test_' + target]
+    clf = clone(model)
+    weights = sample_weights(np.asarray(T_train), weighting)
+    start = time.perf_counter()
+    if weights is not None and has_fit_parameter(clf, 'sample_weight'):
+        clf.fit(X_train, T_train, sample_weight=weights)
+    else:
+        clf.fit(X_train, T_train)
+    fit_seconds = time.perf_counter() - start
+    groups = np.asarray(group_labels, dtype=object)[shared['G_test']] if group_labels is not None else None
+    positive = list(classes).index(POSITIVE[target]) if POSITIVE.get(target) in list(classes) else None
+    report = Report.from_predictions(classes[T_test], classes[predict_batched(clf, X_test)], classes, groups,
+                                     classes[positive] if positive is not None else None, target)
+    return {'report': report, 'fit_seconds': fit_seconds, 'model': clf if keep_model else None}
+
+
+def train_targets(train, test, targets=tuple(TARGET_COLUMNS), models=None, preparer='normal', weighting='balanced',
+                  groups='Driver_Race', n_jobs=-1, keep_models=False, plots=None, verbose=0):
+    # Returns a summary table with one row per target and model, and the full results
+    # ({(target, model): {'report', 'fit_seconds', 'model'}})
+    models = MODELS if models is None else models
+    X_train = prepare_features(train, preparer)
+    X_test = prepare_features(test, preparer).reindex(columns=X_train.columns, fill_value=0)
+
+    matrices = {'X_train': X_train, 'X_test': X_test}
+    classes = {}
+    for target in targets:
+        column = TARGET_COLUMNS[target]
+        matrices['T_train_' + target], classes[target] = encode_target(train[column])
+        matrices['T_test_' + target], _ = encode_target(test[column], classes[target])
+    group_labels = None
+    if groups is not None:
+        categorical = pd.Categorical(test[groups])
+        group_labels = list(categorical.categories) + ['Missing']
+        matrices['G_test'] = np.where(categorical.codes < 0, len(group_labels) - 1, categorical.codes)
+
+    path = shared_directory()
+    try:
+        shared = share_matrices(matrices, path, frames=False)
+        tasks = [(target, name) for target in targets for name in models]
+        outputs = Parallel(n_jobs=n_jobs, verbose=verbose)(
+            delayed(fit_target)(models[name], target, shared, classes[target], group_labels, weighting, keep_models)
+            for target, name in tasks)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    results = dict(zip(tasks, outputs))
+    rows = []
+    for (target, name), result in results.items():
+        report = result['report']
+        per_class = report.per_class()
+        rows.append(dict({
+            'target': target, 'model': name, 'classes': len(report.classes),
+            'accuracy': report.accuracy, 'mcc': report.mcc,
+            'macro_f1': per_class['f1-score'].mean(),
+            'positive_recall': per_class['recall'].iloc[report.positive],
+            'fit_seconds': result['fit_seconds'],
+        }, **(report.fairness_gaps() if groups is not None else {})))
+        if plots is not None:
+            plots.confusion_matrix(report, '{} - {}'.format(target, name))
+    return pd.DataFrame(rows), results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train search, arrest and outcome models on one feature matrix.')
+    parser.add_argument('--train', default='Processed_Data/stops_2020_train.csv')
+    parser.add_argument('--test', default='Processed_Data/stops_2020_test.csv')
+    parser.add_argument('--targets', nargs='+', choices=list(TARGET_COLUMNS), default=list(TARGET_COLUMNS))
+    parser.add_argument('--models', nargs='+', choices=list(MODELS), default=['Logistic Reg', 'GaussianNB'])
+    parser.add_argument('--preparer', choices=list(PREPARERS), default='normal')
+    parser.add_argument('--weighting', choices=WEIGHTINGS, default='balanced')
+    parser.add_argument('--jobs', type=int, default=-1)
+    parser.add_argument('--plot-dir', help='write the confusion matrices here')
+    parser.add_argument('--output', help='write the summary table to this csv')
+    args = parser.parse_args()
+
+    from compaction import compact_stops
+    from evaluation import PlotWriter
+    train = compact_stops(pd.read_csv(args.train))
+    test = compact_stops(pd.read_csv(args.test))
+    plots = PlotWriter(args.plot_dir) if args.plot_dir else None
+    summary, results = train_targets(train, test, args.targets, {name: MODELS[name] for name in args.models},
+                                     args.preparer, args.weighting, n_jobs=args.jobs, plots=plots)
+    with pd.option_context('display.max_columns', 50, 'display.width', 250):
+        print(summary)
+    for (target, name), result in results.items():
+        print('\n{} - {}\n{}'.format(target, name, result['report'].classification_report()))
+    if plots is not None:
+        plots.close()
+    if args.output:
+        summary.to_csv(args.output, index=False)
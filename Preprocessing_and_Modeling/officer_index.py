@@ -0,0 +1,164 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from stop_labels import category_codes, month_labels
+
+# Officer-attribute index: stop counts per month, years-of-service bucket, officer race and
+# gender, CMPD division, driver race, search flag and outcome, stored as the non-empty cells
+# of that cube in one csv. Built by the preprocessing pipeline (--officer-index) and only
+# extended with months it has not seen. The dashboard's "Officer Years of Service" chart and
+# the "officer" model preparer (modeling_functions.prepare_officer) both use its bucketing
+# and groupings, so they agree at the bucket edges.
+#
+#   python Preprocessing_and_Modeling/officer_index.py --update Processed_Data/stops_2020_trimmed.csv
+
+SERVICE_BUCKET_YEARS = 4
+# 0 years, then 1-4, 5-8, ..., 33-36 and everything above
+SERVICE_LABELS = ['0'] + ['{}-{}'.format(SERVICE_BUCKET_YEARS * k - 3, SERVICE_BUCKET_YEARS * k)
+                          for k in range(1, 10)] + ['37+']
+GENDER_LABELS = ['Female', 'Male']  # LabelEncoder codes of Officer_Gender/Driver_Gender
+INDEX_COLUMNS = ['month', 'Officer_Service_Bucket', 'Officer_Race', 'Officer_Gender', 'CMPD_Division',
+                 'Driver_Race', 'Was_a_Search_Conducted', 'Outcome']
+INDEX_FILE = 'officer_index.csv'
+OFFICER_INDEX = 'Officer_Index'
+
+
+def service_bucket(years):
+    # Bucket codes into SERVICE_LABELS: 0 -> '0', 1-4 -> '1-4', 5-8 -> '5-8', ...
+    years = np.asarray(years).astype(np.int64)
+    return np.clip((years + SERVICE_BUCKET_YEARS - 1) // SERVICE_BUCKET_YEARS, 0, len(SERVICE_LABELS) - 1)
+
+
+def officer_group(race, gender):
+    # 'Black Male', 'White Female', ... from the distinct race labels only
+    race_codes, races = category_codes(pd.Series(race))
+    genders = np.asarray(gender).astype(np.int64)
+    groups = np.array(['{} {}'.format(r, g) for r in races for g in GENDER_LABELS])
+    return groups[race_codes * len(GENDER_LABELS) + genders]
+
+
+def add_officer_features(data):
+    # The index's officer attributes as model features: ordinal service bucket and race/gender group
+    return data.assign(Officer_Service_Bucket=service_bucket(data['Officer_Years_of_Service']),
+                       Officer_Group=officer_group(data['Officer_Race'], data['Officer_Gender']))
+
+
+def _dimension(stops, column):
+    # (codes, labels) of one index column
+    if column == 'month':
+        months = month_labels(stops['Month_of_Stop'])
+        return np.asarray(months.codes, np.int64), np.asarray(months.categories)
+    if column == 'Officer_Service_Bucket':
+        return service_bucket(stops['Officer_Years_of_Service']), np.asarray(SERVICE_LABELS)
+    if column == 'Officer_Gender':
+        return np.asarray(stops[column]).astype(np.int64), np.asarray(GENDER_LABELS)
+    if column == 'Was_a_Search_Conducted':
+        return np.asarray(stops[column]).astype(np.int64), np.array([0, 1])
+    codes, labels = category_codes(stops[column])
+    return codes, np.asarray(labels)
+
+
+def index_counts(stops):
+    # Non-empty cells of the month x officer x division x driver race x search x outcome cube
+    dims = [_dimension(stops, column) for column in INDEX_COLUMNS]
+    dated = dims[0][0] >= 0
+    shape = tuple(len(labels) for _, labels in dims)
+    cells = np.ravel_multi_index([codes[dated] for codes, _ in dims], shape)
+    cells, counts = np.unique(cells, return_counts=True)
+    index = pd.DataFrame({column: labels[codes] for column, (_, labels), codes
+                          in zip(INDEX_COLUMNS, dims, np.unravel_index(cells, shape))})
+    return index.assign(stops=counts)
+
+
+class OfficerIndex:
+
+    def __init__(self, directory=OFFICER_INDEX):
+        self.directory = directory
+        path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(path):
+            counts = pd.read_csv(path, dtype={'month': str, 'Officer_Service_Bucket': str})
+        else:
+            counts = pd.DataFrame(columns=INDEX_COLUMNS + ['stops'])
+        self.counts = self._typed(counts)
+
+    @staticmethod
+    def _typed(counts):
+        counts = counts.astype({'Was_a_Search_Conducted': np.int64, 'stops': np.int64})
+        counts['Officer_Service_Bucket'] = pd.Categorical(counts['Officer_Service_Bucket'], categories=SERVICE_LABELS,
+                                                          ordered=True)
+        counts['year'] = counts['month'].str[:4]
+        return counts
+
+    @property
+    def months(self):
+        return sorted(self.counts['month'].unique())
+
+    def update(self, stops, refresh=()):
+        # Adds the months not indexed yet (plus any in refresh); returns the months added
+        months = month_labels(stops['Month_of_Stop'])
+        wanted = [m for m in months.categories if m not in set(self.months) or m in set(refresh)]
+        if not wanted:
+            return []
+        new = self._typed(index_counts(stops[np.isin(np.asarray(months), wanted)]))
+        kept = self.counts[~self.counts['month'].isin(wanted)]
+        self.counts = pd.concat([kept, new], ignore_index=True).sort_values(INDEX_COLUMNS, ignore_index=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self.counts.drop(columns='year').to_csv(os.path.join(self.directory, INDEX_FILE), index=False)
+        return sorted(wanted)
+
+    def select(self, filters=None):
+        # Index rows matching the filters (column -> list of values); empty filters keep everything
+        counts = self.counts
+        for column, values in (filters or {}).items():
+            if values is not None and len(values):
+                counts = counts[counts[column].isin(values)]
+        return counts
+
+    def service_table(self, years=None, divisions=None, search=1):
+        # Stops per service bucket (rows) and driver race (columns)
+        data = self.select({'year': years, 'CMPD_Division': divisions, 'Was_a_Search_Conducted': [search]})
+        table = data.groupby(['Officer_Service_Bucket', 'Driver_Race'], observed=True)['stops'].sum().unstack(
+            fill_value=0)
+        table.index = pd.Index(table.index.astype(str), name='Officer_Years_of_Service')
+        return table
+
+    def officer_rates(self, by=('Officer_Service_Bucket', 'Officer_Race', 'Officer_Gender'), filters=None):
+        # Stops, search rate and outcome shares per officer grouping
+        data = self.select(filters)
+        grouped = data.groupby(list(by), observed=True)
+        stops = grouped['stops'].sum()
+        table = pd.DataFrame({'stops': stops,
+                              'search_rate': data[data['Was_a_Search_Conducted'] == 1].groupby(
+                                  list(by), observed=True)['stops'].sum().reindex(stops.index, fill_value=0) / stops})
+        outcomes = data.pivot_table(index=list(by), columns='Outcome', values='stops', aggfunc='sum', fill_value=0,
+                                    observed=True)
+        outcomes = outcomes.reindex(stops.index, fill_value=0).div(stops, axis=0)
+        outcomes.columns = ['{}_rate'.format(c.split('/')[0].lower()) for c in outcomes.columns]
+        return table.join(outcomes)
+
+
+def update_officer_index(stops, directory=OFFICER_INDEX, quiet=False):
+    # Pipeline stage: extends the index with the months of this run that it has not seen
+    added = OfficerIndex(directory).update(stops)
+    if not quiet:
+        print('officer index: {} new month(s) {}'.format(len(added), ', '.join(added)))
+    return stops
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Officer-attribute index of the traffic stops.')
+    parser.add_argument('--index', default=OFFICER_INDEX, help='directory of the index')
+    parser.add_argument('--update', nargs='*', default=[], help='processed stops csvs to add (new months only)')
+    parser.add_argument('--refresh', nargs='*', default=[], help='months (YYYY-MM) to re-index')
+    parser.add_argument('--by', nargs='+', default=['Officer_Service_Bucket', 'Officer_Race', 'Officer_Gender'])
+    parser.add_argument('--years', nargs='*', help='restrict the rates to these years')
+    args = parser.parse_args()
+
+    index = OfficerIndex(args.index)
+    for path in args.update:
+        print(path, 'added months:', index.update(pd.read_csv(path), args.refresh))
+    with pd.option_context('display.max_rows', 200, 'display.width', 200):
+        print(index.officer_rates(args.by, {'year': args.years}))
@@ -0,0 +1,105 @@
+import atexit
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Encoded train/test matrices written once to .npy files and attached as read-only
+# memory maps, so parallel model fitting (GridSearchCV/SFS with n_jobs, the fairness
+# sweep, experiments.py) does not pickle a copy of the data into every worker.
+#
+# Features are stored as one C-contiguous float32 matrix (OH_Encode columns, flags, ages
+# and years of service are all exact in float32), targets as uint8. Estimators that work
+# in float64, e.g. LogisticRegression with lbfgs, still make their own float64 copy of
+# what they are fitted on; the shared pages save the pickled copy per worker. The frames
+# returned by load_matrices wrap the maps without copying; joblib forwards memory-mapped
+# arrays (and frames over them) to its workers by file name, so every worker reads the
+# same pages. By default the files go to /dev/shm, i.e. shared memory, where it exists;
+# directories from shared_directory are removed by release_matrices or at interpreter exit.
+
+META = 'meta.json'
+FEATURE_DTYPE = np.float32
+TARGET_DTYPE = np.uint8
+
+
+def feature_matrix(X):
+    return np.ascontiguousarray(np.asarray(X, dtype=FEATURE_DTYPE))
+
+
+def target_vector(T):
+    values = np.asarray(T)
+    if values.dtype == bool:
+        return values.astype(TARGET_DTYPE)
+    if not np.issubdtype(values.dtype, np.integer):
+        raise ValueError('targets must be label-encoded integers, got {}'.format(values.dtype))
+    if len(values) and (values.min() < 0 or values.max() > np.iinfo(TARGET_DTYPE).max):
+        raise ValueError('target codes do not fit {}'.format(np.dtype(TARGET_DTYPE).name))
+    return values.astype(TARGET_DTYPE)
+
+
+def shared_directory():
+    path = tempfile.mkdtemp(prefix='cmpd_matrices_', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    # /dev/shm is RAM: do not leave a copy of the matrices behind when the process (kernel) ends
+    atexit.register(shutil.rmtree, path, True)
+    return path
+
+
+def write_matrices(path, matrices):
+    # matrices: name -> DataFrame/2-d array (features) or Series/1-d array (targets)
+    os.makedirs(path, exist_ok=True)
+    meta = {}
+    for name, value in matrices.items():
+        if np.ndim(value) == 2:
+            values = feature_matrix(value)
+            info = {'columns': [str(c) for c in value.columns] if isinstance(value, pd.DataFrame) else None}
+        else:
+            values = target_vector(value)
+            info = {'name': value.name if isinstance(value, pd.Series) else None}
+        np.save(os.path.join(path, name + '.npy'), values)
+        meta[name] = dict(info, file=name + '.npy', dtype=values.dtype.name, shape=list(values.shape))
+    with open(os.path.join(path, META), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return path
+
+
+def load_matrices(path, mmap=True, frames=True):
+    # Read-only when memory mapped. With frames=True named matrices come back as
+    # DataFrames/Series (RangeIndex) over the maps, otherwise as plain arrays.
+    with open(os.path.join(path, META)) as f:
+        meta = json.load(f)
+    loaded = {}
+    for name, info in meta.items():
+        values = np.load(os.path.join(path, info['file']), mmap_mode='r' if mmap else None)
+        if frames and info.get('columns') is not None:
+            values = pd.DataFrame(values, columns=info['columns'], copy=False)
+        elif frames and 'name' in info:
+            values = pd.Series(values, name=info['name'], copy=False)
+        loaded[name] = values
+    return loaded
+
+
+def share_matrices(matrices, path=None, frames=True):
+    # Writes the matrices (to a fresh shared-memory directory by default) and returns the mapped copies
+    path = shared_directory() if path is None else path
+    write_matrices(path, matrices)
+    return load_matrices(path, frames=frames)
+
+
+def matrices_path(loaded):
+    # Directory behind matrices returned by load_matrices/share_matrices, e.g. to remove it
+    value = next(iter(loaded.values()))
+    values = value.values if isinstance(value, (pd.DataFrame, pd.Series)) else value
+    while not isinstance(values, np.memmap) and getattr(values, 'base', None) is not None:
+        values = values.base
+    return os.path.dirname(values.filename) if isinstance(values, np.memmap) else None
+
+
+def release_matrices(loaded):
+    # Removes the files behind matrices returned by share_matrices; the maps must not be used afterwards
+    path = matrices_path(loaded)
+    if path is not None:
+        shutil.rmtree(path, ignore_errors=True)
+    return path
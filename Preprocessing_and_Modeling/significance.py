@@ -0,0 +1,219 @@
+import argparse
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2 as chi2_distribution
+
+# Permutation and bootstrap tests for group (e.g. Driver_Race) x outcome disparities,
+# optionally within strata such as CMPD_Division, year or officer attributes.
+#
+# The stops are reduced to one (strata, groups, outcomes) count array with a single
+# np.bincount over the encoded codes. Replicates are then drawn from the tables rather
+# than by reshuffling rows, which is exact and independent of the number of stops:
+#   permutation - shuffling outcomes across stops keeps both margins of a table fixed, so
+#                 permuted tables are multivariate hypergeometric, drawn cell by cell;
+#   bootstrap   - resampling stops with replacement gives multinomial tables.
+# Strata are independent and are spread over processes with n_jobs > 1; every stratum
+# gets its own seed, so results do not depend on n_jobs.
+#
+#   python Preprocessing_and_Modeling/significance.py --outcome Arrest --by CMPD_Division year
+
+# Outcome level counted as the "positive" result (search: LabelEncoder No=0, Yes=1)
+POSITIVE = {'Arrest': 'Arrest', 'Outcome': 'Arrest', 'Result_of_Stop': 'Arrest', 'Was_a_Search_Conducted': 1}
+REPLICATES = 10000
+CONFIDENCE = 0.95
+
+
+def _column(stops, name):
+    if name == 'year' and 'year' not in stops:
+        return pd.Series(pd.DatetimeIndex(pd.to_datetime(stops['Month_of_Stop'].astype(str))).year, index=stops.index)
+    return stops[name]
+
+
+def _codes(column):
+    categorical = column if isinstance(column.dtype, pd.CategoricalDtype) else column.astype('category')
+    categorical = categorical.cat.remove_unused_categories()
+    return categorical.cat.codes.to_numpy().astype(np.int64), list(categorical.cat.categories)
+
+
+def contingency(stops, group='Driver_Race', outcome='Arrest', by=None):
+    # Returns counts shaped (strata, groups, outcomes) with the labels of every axis;
+    # stops with a missing value in any of the columns are left out.
+    by = list(by or [])
+    group_codes, groups = _codes(_column(stops, group))
+    outcome_codes, outcomes = _codes(_column(stops, outcome))
+    valid = (group_codes >= 0) & (outcome_codes >= 0)
+    if by:
+        codes, labels = zip(*[_codes(_column(stops, name)) for name in by])
+        for c in codes:
+            valid &= c >= 0
+        shape = tuple(len(l) for l in labels)
+        strata = np.ravel_multi_index([c[valid] for c in codes], shape)
+        stratum_labels = list(pd.MultiIndex.from_product(labels, names=by)) if len(by) > 1 else list(labels[0])
+    else:
+        strata = np.zeros(valid.sum(), np.int64)
+        stratum_labels = ['all']
+    flat = (strata * len(groups) + group_codes[valid]) * len(outcomes) + outcome_codes[valid]
+    size = len(stratum_labels) * len(groups) * len(outcomes)
+    tables = np.bincount(flat, minlength=size).reshape(len(stratum_labels), len(groups), len(outcomes))
+    observed = tables.sum(axis=(1, 2)) > 0
+    return tables[observed], [s for s, o in zip(stratum_labels, observed) if o], groups, outcomes
+
+
+def chi2_statistic(tables):
+    # Pearson chi-square over the last two axes; empty rows/columns contribute nothing
+    tables = np.asarray(tables, dtype=float)
+    rows = tables.sum(axis=-1, keepdims=True)
+    cols = tables.sum(axis=-2, keepdims=True)
+    n = rows.sum(axis=-2, keepdims=True)
+    expected = rows * cols / np.where(n > 0, n, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(expected > 0, (tables - expected) ** 2 / expected, 0.0)
+    return terms.sum(axis=(-2, -1))
+
+
+def permutation_tables(table, replicates, rng):
+    # Tables with the margins of `table`, distributed as if outcomes were shuffled across stops
+    table = np.asarray(table, dtype=np.int64)
+    n_groups, n_outcomes = table.shape
+    remaining = np.broadcast_to(table.sum(axis=0), (replicates, n_outcomes)).copy()
+    samples = np.zeros((replicates, n_groups, n_outcomes), np.int64)
+    for g, row_total in enumerate(table.sum(axis=1)):
+        if g == n_groups - 1:
+            samples[:, g] = remaining
+            break
+        left = np.full(replicates, row_total, np.int64)
+        rest = remaining.sum(axis=1)
+        for o in range(n_outcomes - 1):
+            rest = rest - remaining[:, o]
+            samples[:, g, o] = rng.hypergeometric(remaining[:, o], rest, left) if row_total else 0
+            left -= samples[:, g, o]
+        samples[:, g, -1] = left
+        remaining -= samples[:, g]
+    return samples
+
+
+def bootstrap_tables(table, replicates, rng):
+    # Tables of stops resampled with replacement
+    table = np.asarray(table, dtype=np.int64)
+    n = table.sum()
+    return rng.multinomial(n, table.ravel() / max(n, 1), size=replicates).reshape((replicates,) + table.shape)
+
+
+def positive_rates(tables, positive):
+    tables = np.asarray(tables, dtype=float)
+    stops = tables.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return tables[..., positive] / stops
+
+
+def _p_percent(rates):
+    # min/max ratio of the groups' positive rates (the p% rule, for any number of groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nanmin(rates, axis=-1) / np.nanmax(rates, axis=-1)
+
+
+def _test_table(table, positive, reference, replicates, confidence, seed):
+    rng = np.random.default_rng(seed)
+    observed = chi2_statistic(table)
+    permuted = chi2_statistic(permutation_tables(table, replicates, rng))
+    boot_rates = positive_rates(bootstrap_tables(table, replicates, rng), positive)
+    rates = positive_rates(table, positive)
+    alpha = (1 - confidence) / 2
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        # all-empty groups give nan rates and all-nan quantiles
+        warnings.simplefilter('ignore', RuntimeWarning)
+        ratios = boot_rates / boot_rates[:, [reference]] if reference is not None else boot_rates
+        p_percent = _p_percent(boot_rates)
+        ratio_ci = np.nanquantile(ratios, [alpha, 1 - alpha], axis=0)
+        rate_ci = np.nanquantile(boot_rates, [alpha, 1 - alpha], axis=0)
+        p_percent_ci = np.nanquantile(p_percent, [alpha, 1 - alpha])
+    dof = max((int((table.sum(axis=1) > 0).sum()) - 1) * (int((table.sum(axis=0) > 0).sum()) - 1), 1)
+    return {
+        'rates': rates, 'rate_ci': rate_ci, 'ratio_ci': ratio_ci,
+        'chi2': float(observed), 'p_value': float((1 + (permuted >= observed - 1e-9).sum()) / (1 + replicates)),
+        'p_value_asymptotic': float(chi2_distribution.sf(observed, dof)),
+        'p_percent': float(_p_percent(rates)), 'p_percent_ci': p_percent_ci,
+    }
+
+
+def _run_tests(args):
+    return [_test_table(*a) for a in args]
+
+
+def disparity_test(stops, group='Driver_Race', outcome='Arrest', by=None, positive=None, reference='White',
+                   replicates=REPLICATES, confidence=CONFIDENCE, seed=0, n_jobs=1):
+    # One row per stratum and group: positive-outcome rate with bootstrap interval, rate
+    # ratio to the reference group, and the stratum's chi-square with its permutation
+    # p-value and the p% score (min/max group rate) with bootstrap interval.
+    tables, strata, groups, outcomes = contingency(stops, group, outcome, by)
+    positive = POSITIVE.get(outcome, outcomes[-1]) if positive is None else positive
+    if positive not in outcomes:
+        raise ValueError('{} is not a value of {}: {}'.format(positive, outcome, outcomes))
+    positive_index = outcomes.index(positive)
+    reference_index = groups.index(reference) if reference in groups else None
+
+    seeds = np.random.SeedSequence(seed).spawn(len(tables))
+    tasks = [(table, positive_index, reference_index, replicates, confidence, s) for table, s in zip(tables, seeds)]
+    # n_jobs as in joblib: -1 is every core, -2 all but one, ...
+    workers = n_jobs if n_jobs > 0 else max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        results = _run_tests(tasks)
+    else:
+        chunks = [tasks[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunked = list(pool.map(_run_tests, chunks))
+        results = [None] * len(tasks)
+        for i, chunk in enumerate(chunked):
+            results[i::workers] = chunk
+
+    by = list(by or [])
+    rows = []
+    for stratum, table, result in zip(strata, tables, results):
+        key = dict(zip(by, stratum if isinstance(stratum, tuple) else (stratum,))) if by else {}
+        reference_rate = result['rates'][reference_index] if reference_index is not None else np.nan
+        for g, name in enumerate(groups):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = result['rates'][g] / reference_rate
+            rows.append(dict(key, **{
+                group: name, 'stops': int(table[g].sum()), 'positives': int(table[g, positive_index]),
+                'rate': result['rates'][g], 'rate_low': result['rate_ci'][0, g], 'rate_high': result['rate_ci'][1, g],
+                'ratio': ratio, 'ratio_low': result['ratio_ci'][0, g], 'ratio_high': result['ratio_ci'][1, g],
+                'chi2': result['chi2'], 'p_value': result['p_value'],
+                'p_value_asymptotic': result['p_value_asymptotic'], 'p_percent': result['p_percent'],
+                'p_percent_low': result['p_percent_ci'][0], 'p_percent_high': result['p_percent_ci'][1],
+            }))
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Permutation/bootstrap tests for race x outcome disparities.')
+    parser.add_argument('--data', default='Processed_Data/stops_2020_trimmed.csv')
+    parser.add_argument('--group', default='Driver_Race')
+    parser.add_argument('--outcome', nargs='+', default=['Arrest', 'Was_a_Search_Conducted'])
+    parser.add_argument('--by', nargs='*', default=[], help='strata, e.g. CMPD_Division year Officer_Race')
+    parser.add_argument('--reference', default='White')
+    parser.add_argument('--replicates', type=int, default=REPLICATES)
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this csv')
+    args = parser.parse_args()
+
+    from compaction import compact_stops
+    stops = compact_stops(pd.read_csv(args.data))
+    results = []
+    for outcome in args.outcome:
+        result = disparity_test(stops, args.group, outcome, args.by, reference=args.reference,
+                                replicates=args.replicates, confidence=args.confidence, seed=args.seed,
+                                n_jobs=args.jobs)
+        results.append(result.assign(outcome=outcome))
+    results = pd.concat(results, ignore_index=True)
+    with pd.option_context('display.max_rows', 200, 'display.width', 200):
+        print(results)
+    if args.output:
+        results.to_csv(args.output, index=False)
@@ -0,0 +1,125 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+# Per-stage wall time, row counts and memory deltas for the preprocessing pipeline,
+# with optional cProfile / tracemalloc hooks for selected stages.
+
+PROFILERS = ('cprofile', 'tracemalloc')
+
+
+def rss_bytes():
+    # Resident set size of this process; falls back to the peak where /proc is missing
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def count_rows(obj):
+    if isinstance(obj, pd.DataFrame):
+        return len(obj)
+    if isinstance(obj, dict):
+        return {k: len(v) for k, v in obj.items() if isinstance(v, pd.DataFrame)}
+    return None
+
+
+class StageRecorder:
+
+    def __init__(self, profile=None, profile_stages=None, profile_dir=None):
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError('profile must be one of {}, got {!r}'.format(PROFILERS, profile))
+        self.profile = profile
+        self.profile_stages = None if profile_stages is None else set(profile_stages)
+        self.profile_dir = profile_dir
+        self.records = []
+
+    def _profiled(self, name):
+        return self.profile is not None and (self.profile_stages is None or name in self.profile_stages)
+
+    def run(self, name, func, *args, **kwargs):
+        record = {'stage': name, 'rows_in': count_rows(args[0]) if args else None}
+        profiler = None
+        was_tracing = tracemalloc.is_tracing()
+        if self._profiled(name):
+            if self.profile == 'cprofile':
+                profiler = cProfile.Profile()
+                profiler.enable()
+            elif was_tracing:
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        try:
+            out = func(*args, **kwargs)
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            record['rss_delta_bytes'] = rss_bytes() - rss_before
+            if profiler is not None:
+                profiler.disable()
+                record['profile'] = self._save_cprofile(name, profiler)
+            elif self._profiled(name):
+                record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+                record['top_allocations'] = [str(stat) for stat in top]
+                if not was_tracing:
+                    tracemalloc.stop()
+
+        record['rows_out'] = count_rows(out)
+        self.records.append(record)
+        return out
+
+    def add(self, name, seconds, rows_in=None, rows_out=None, within=None):
+        # Records a stage timed elsewhere, e.g. validation accumulated over ingest chunks.
+        # within names the stage whose time already includes it; its memory is not measured.
+        self.records.append({'stage': name, 'rows_in': rows_in, 'seconds': seconds,
+                             'rss_delta_bytes': None, 'rows_out': rows_out, 'within': within})
+
+    def _save_cprofile(self, name, profiler):
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, '{}.prof'.format(name))
+            profiler.dump_stats(path)
+            return path
+        buffer = io.StringIO()
+        pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(15)
+        return buffer.getvalue()
+
+    def summary(self):
+        # the stage column fits the longest stage name (e.g. officer_index)
+        width = max([len('stage')] + [len(r['stage']) for r in self.records])
+        lines = ['{:<{w}} {:>9} {:>12} {:>12} {:>12}'.format('stage', 'seconds', 'rows in', 'rows out', 'rss delta',
+                                                            w=width)]
+        for r in self.records:
+            lines.append('{:<{w}} {:>9.3f} {:>12} {:>12} {:>12}'.format(
+                r['stage'], r['seconds'], _fmt_rows(r['rows_in']), _fmt_rows(r['rows_out']),
+                _fmt_bytes(r['rss_delta_bytes']), w=width))
+        return '\n'.join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.records, f, indent=2)
+
+
+def _fmt_bytes(size):
+    return '-' if size is None else '{:.1f}MB'.format(size / 2 ** 20)
+
+
+def _fmt_rows(rows):
+    if rows is None:
+        return '-'
+    if isinstance(rows, dict):
+        return str(max(rows.values(), default=0))
+    return str(rows)
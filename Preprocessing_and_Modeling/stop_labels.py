@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+# Code/label helpers shared by drift_monitor.py and officer_index.py. Kept to numpy and
+# pandas, since the dashboard and the aggregation service import officer_index.py at
+# start-up.
+
+MISSING = 'Missing'
+
+
+def month_labels(column):
+    # 'YYYY-MM' codes per row; the conversion runs on the distinct values only
+    categorical = column if isinstance(column.dtype, pd.CategoricalDtype) else column.astype('category')
+    months = pd.to_datetime(pd.Series(categorical.cat.categories).astype(str)).dt.strftime('%Y-%m')
+    return pd.Categorical.from_codes(categorical.cat.codes, categories=months.unique()) \
+        if months.is_unique else pd.Categorical(np.asarray(months)[categorical.cat.codes])
+
+
+def category_codes(column):
+    # int64 codes and string labels; missing values get their own MISSING label
+    categorical = column if isinstance(column.dtype, pd.CategoricalDtype) else column.astype('category')
+    labels = [str(c) for c in categorical.cat.categories]
+    codes = categorical.cat.codes.to_numpy().astype(np.int64)
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append(MISSING)
+    return codes, labels
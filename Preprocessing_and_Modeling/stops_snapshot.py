@@ -0,0 +1,94 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Binary snapshot of a compacted stops frame that loads as read-only memory maps.
+#
+# Columns sharing a numpy dtype are stored together as one (n_columns, n_rows) array,
+# which is exactly the block layout pandas uses, so the loaded frame wraps the mapped
+# pages instead of copying them. Categoricals are stored as their integer codes with
+# the categories in meta.json. Every process that loads the same snapshot shares one
+# copy of the data through the page cache. meta.json also records the size and mtime of
+# the csv the snapshot was built from, so a re-exported csv is noticed (snapshot_current).
+
+META = 'meta.json'
+
+
+def _group_name(dtype):
+    return 'block_' + np.dtype(dtype).name
+
+
+def source_stamp(source):
+    # size and modification time of a snapshot's source csv
+    stat = os.stat(source)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def write_snapshot(stops, path, source=None):
+    os.makedirs(path, exist_ok=True)
+    meta = {'rows': len(stops), 'columns': list(stops.columns), 'categoricals': {}, 'blocks': {},
+            'source': source_stamp(source) if source is not None else None}
+
+    groups = {}
+    for name in stops.columns:
+        col = stops[name]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            categories = list(col.cat.categories)
+            kind = 'date' if categories and isinstance(categories[0], datetime.date) else 'value'
+            if kind == 'date':
+                categories = [c.isoformat() for c in categories]
+            np.save(os.path.join(path, 'codes_{}.npy'.format(len(meta['categoricals']))), col.cat.codes.to_numpy())
+            meta['categoricals'][name] = {'file': 'codes_{}.npy'.format(len(meta['categoricals'])),
+                                          'categories': [c.item() if hasattr(c, 'item') else c for c in categories],
+                                          'kind': kind, 'ordered': bool(col.cat.ordered)}
+        else:
+            groups.setdefault(_group_name(col.dtype), []).append(name)
+
+    for group, names in groups.items():
+        np.save(os.path.join(path, group + '.npy'), np.ascontiguousarray(stops[names].to_numpy().T))
+        meta['blocks'][group] = names
+
+    with open(os.path.join(path, META), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return path
+
+
+def load_snapshot(path, mmap=True):
+    # Read-only when memory mapped: filter or copy before modifying. Columns come back
+    # grouped by dtype; selecting them in the original order would copy every block.
+    with open(os.path.join(path, META)) as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+
+    frames = []
+    for group, names in meta['blocks'].items():
+        values = np.load(os.path.join(path, group + '.npy'), mmap_mode=mode)
+        frames.append(pd.DataFrame(values.T, columns=names, copy=False))
+    for name, info in meta['categoricals'].items():
+        codes = np.load(os.path.join(path, info['file']), mmap_mode=mode)
+        categories = info['categories']
+        if info['kind'] == 'date':
+            categories = [datetime.date.fromisoformat(c) for c in categories]
+        dtype = pd.CategoricalDtype(categories, ordered=info['ordered'])
+        frames.append(pd.Series(pd.Categorical.from_codes(codes, dtype=dtype), name=name).to_frame())
+
+    if not frames:
+        return pd.DataFrame(index=range(meta['rows']))
+    return pd.concat(frames, axis=1, copy=False)
+
+
+def snapshot_exists(path):
+    return os.path.exists(os.path.join(path, META))
+
+
+def snapshot_current(path, source):
+    # True if the snapshot was built from the source csv as it is now (or the csv is gone)
+    if not snapshot_exists(path):
+        return False
+    if not os.path.exists(source):
+        return True
+    with open(os.path.join(path, META)) as f:
+        return json.load(f).get('source') == source_stamp(source)
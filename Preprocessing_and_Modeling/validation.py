@@ -0,0 +1,142 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+# Declared schema for the raw Officer_Traffic_Stops extracts, checked chunk by chunk
+# during ingest. All rules of a chunk are evaluated into one boolean matrix so that
+# counting, sampling and filtering happen in a single vectorized pass.
+
+SCHEMA = {
+    'Month_of_Stop': {'dates': ('2016-01-01', None)},
+    'Reason_for_Stop': {'categories': ['CheckPoint', 'Driving While Impaired', 'Investigation', 'Other',
+                                       'Safe Movement', 'SeatBelt', 'Speeding', 'Stop Light/Sign',
+                                       'Vehicle Equipment', 'Vehicle Regulatory']},
+    'Officer_Race': {'categories': ['2 or More', 'American Indian/Alaska Native', 'Asian / Pacific Islander',
+                                    'Black/African American', 'Hispanic/Latino', 'Not Specified', 'White']},
+    'Officer_Gender': {'categories': ['Female', 'Male']},
+    'Officer_Years_of_Service': {'range': (0, 50)},
+    'Driver_Race': {'categories': ['Asian', 'Black', 'Native American', 'Other/Unknown', 'White']},
+    'Driver_Ethnicity': {'categories': ['Hispanic', 'Non-Hispanic']},
+    'Driver_Gender': {'categories': ['Female', 'Male']},
+    # 15 is the earliest age eligible for a driver's permit; ages 10-14 show up in the extracts
+    'Driver_Age': {'range': (15, 110)},
+    'Was_a_Search_Conducted': {'categories': ['No', 'Yes']},
+    'Result_of_Stop': {'categories': ['Arrest', 'Citation Issued', 'No Action Taken', 'Verbal Warning',
+                                      'Written Warning']},
+    # Missing divisions are kept; they are trimmed later for the location analysis
+    'CMPD_Division': {'categories': ['Central Division', 'Eastway Division', 'Freedom Division',
+                                     'Hickory Grove Division', 'Independence Division', 'Metro Division',
+                                     'North Division', 'North Tryon Division', 'Providence Division',
+                                     'South Division', 'Steele Creek Division', 'University City Division',
+                                     'Westover Division'],
+                      'nullable': True},
+}
+
+POLICIES = ('drop', 'quarantine', 'report')
+
+
+def rule_masks(chunk, schema=SCHEMA):
+    # {rule name: boolean array of violating rows} for one chunk
+    masks = {}
+    for col, rule in schema.items():
+        if col not in chunk:
+            masks[col + ':missing_column'] = np.ones(len(chunk), dtype=bool)
+            continue
+        values = chunk[col]
+        nulls = values.isna().to_numpy()
+        if 'categories' in rule:
+            ok = values.isin(rule['categories']).to_numpy()
+            kind = 'category'
+        elif 'range' in rule:
+            lo, hi = rule['range']
+            # values that are not numbers at all (e.g. 'unknown' ages) violate the type rule
+            numbers = pd.to_numeric(values, errors='coerce')
+            unparsed = numbers.isna().to_numpy() & ~nulls
+            masks[col + ':type'] = unparsed
+            ok = numbers.between(lo, hi).to_numpy() | unparsed
+            kind = 'range'
+        else:
+            lo, hi = rule['dates']
+            hi = pd.Timestamp.now() if hi is None else hi
+            ok = values.between(pd.Timestamp(lo), pd.Timestamp(hi)).to_numpy()
+            kind = 'date'
+        if rule.get('nullable'):
+            masks[col + ':' + kind] = ~(ok | nulls)
+        else:
+            masks[col + ':' + kind] = ~ok & ~nulls
+            masks[col + ':null'] = nulls
+    return masks
+
+
+class ValidationReport:
+
+    def __init__(self, policy='drop', samples=5):
+        if policy not in POLICIES:
+            raise ValueError('policy must be one of {}, got {!r}'.format(POLICIES, policy))
+        self.policy = policy
+        self.samples = samples
+        self.rows = 0
+        self.rows_with_violations = 0
+        self.counts = {}
+        self.sample_ids = {}
+        self.seconds = 0.0
+        self.quarantined = []
+
+    def validate(self, chunk, ids, source=None, schema=SCHEMA):
+        # Records the chunk's violations and returns it filtered according to the policy.
+        # ids holds the extract's row ids; sampled ones are reported as "source:id".
+        start = time.perf_counter()
+        masks = rule_masks(chunk, schema)
+        names = list(masks)
+        matrix = np.column_stack([masks[n] for n in names]) if names else np.zeros((len(chunk), 0), bool)
+        counts = matrix.sum(axis=0)
+        bad = matrix.any(axis=1)
+
+        self.rows += len(chunk)
+        self.rows_with_violations += int(bad.sum())
+        for j in np.flatnonzero(counts):
+            name = names[j]
+            self.counts[name] = self.counts.get(name, 0) + int(counts[j])
+            sample = self.sample_ids.setdefault(name, [])
+            if len(sample) < self.samples:
+                rows = np.flatnonzero(matrix[:, j])[:self.samples - len(sample)]
+                sample.extend('{}:{}'.format(source, i) if source else str(i) for i in np.asarray(ids)[rows])
+
+        if self.policy != 'report' and bad.any():
+            if self.policy == 'quarantine':
+                rejected = chunk[bad].copy()
+                # traceable to the raw extracts after ingest drops the id columns
+                rejected.insert(0, 'source_id', np.asarray(ids)[bad])
+                rejected.insert(0, 'source', source)
+                rejected['violations'] = [';'.join(names[j] for j in np.flatnonzero(row)) for row in matrix[bad]]
+                self.quarantined.append(rejected)
+            chunk = chunk[~bad]
+        self.seconds += time.perf_counter() - start
+        return chunk
+
+    def quarantine(self):
+        if not self.quarantined:
+            return None
+        return pd.concat(self.quarantined)
+
+    def to_dict(self):
+        return {
+            'policy': self.policy,
+            'rows': self.rows,
+            'rows_with_violations': self.rows_with_violations,
+            'violations': {name: {'count': count, 'sample_ids': self.sample_ids[name]}
+                           for name, count in sorted(self.counts.items())},
+        }
+
+    def summary(self):
+        lines = ['{} of {} rows violate the schema (policy: {})'.format(
+            self.rows_with_violations, self.rows, self.policy)]
+        for name, count in sorted(self.counts.items()):
+            lines.append('  {:<40} {:>10}  e.g. {}'.format(name, count, self.sample_ids[name]))
+        return '\n'.join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
@@ -1,18 +1,32 @@
 
-import pandas as pd
-import matplotlib.pyplot as plt
 import streamlit as st
-import seaborn as sns
 from st_btn_select import st_btn_select
-import datetime as dt
 
-stops = pd.read_csv("Streamlit/stops_2020_trimmed.csv")
-isinstance(stops['Month_of_Stop'], dt.date) # False
-stops['Month_of_Stop'] = stops['Month_of_Stop'].astype('datetime64[ns]')
-stops['Month_of_Stop'] = pd.to_datetime(stops['Month_of_Stop'], format='%y%m%d')
-stops['Month_of_Stop'] = pd.to_datetime(stops['Month_of_Stop']).dt.date
-#stops['Was_a_Search_Conducted'] = [1 if x == 0 else 0 for x in stops['Was_a_Search_Conducted']]
-stops['Was_a_Search_Conducted']= 1 - stops['Was_a_Search_Conducted']
+# The home page needs neither the stops data nor pandas/matplotlib/seaborn. Data pages
+# import their plotting libraries on first use and read a memory-mapped snapshot
+# (Streamlit/build_snapshot.py) that every worker process shares through the page cache.
+# With CMPD_STOPS_SERVICE set to the aggregation service's url (Aggregation_Service/)
+# the pages fetch their tables from it and never load the stops at all. The officer
+# years-of-service chart reads the preprocessing's officer index when one has been built.
+STOPS_CSV = "Streamlit/stops_2020_trimmed.csv"
+STOPS_SNAPSHOT = "Streamlit/stops_snapshot"
+OFFICER_INDEX = "Officer_Index"
+
+
+@st.experimental_singleton
+def load_queries():
+    import os
+    if os.environ.get('CMPD_STOPS_SERVICE'):
+        from stops_client import StopsServiceClient
+        return StopsServiceClient(os.environ['CMPD_STOPS_SERVICE'])
+    import stops_queries as sq
+    officer_index = None
+    if os.path.exists(os.path.join(OFFICER_INDEX, 'officer_index.csv')):
+        from officer_index import OfficerIndex
+        officer_index = OfficerIndex(OFFICER_INDEX)
+    return sq.LocalQueries(sq.load_stops(STOPS_CSV, STOPS_SNAPSHOT), officer_index)
+
+
 page = st_btn_select(
   # The different pages
   ('Home Page','Drivers', 'CMPD Divisions & Officers'),
@@ -54,14 +68,15 @@ if page == 'Home Page':
     Exploratory Data Analysis is made available to others via this Streamlit app, while the entire project and it's results may be found by visiting this project's **[Github.](https://github.com/hrgrafton92/CMPD_Traffic_Stops)**
     '''
     )
-# Total traffic stops plot
-
-import matplotlib.dates as mdates
-from matplotlib.dates import DateFormatter
-import datetime
-from matplotlib.axis import Axis
 
 if page == 'Drivers':
+    import matplotlib.dates as mdates
+    from matplotlib.dates import DateFormatter
+    from matplotlib.axis import Axis
+    import seaborn as sns
+    queries = load_queries()
+
+    # Total traffic stops plot
     selected_options =  st.sidebar.multiselect("Select one or more Driver's Race:",
              ["White", "Black", "Asian","Native American","Other/Unknown"],default=["Black"])
     
@@ -70,14 +85,7 @@ if page == 'Drivers':
     
     selected_year = st.sidebar.multiselect("Select one or both years of traffic stops:",['2020','2021'],default=['2020'])
     
-    data = stops
-    data['year'] = pd.DatetimeIndex(data['Month_of_Stop']).year
-    data['year'] = data['year'].astype(str)
-    data = data[data['year'].str.contains('|'.join(selected_year))]
-    
-    
-    data = data.groupby(['Driver_Race','Month_of_Stop'], as_index=False)['Officer_Race'].count()
-    data = data[data.stack().str.contains('|'.join(selected_options)).any(level=0)]
+    data = queries.stops_by_race_month(selected_year, selected_options)
     
     locator = mdates.MonthLocator()
     date_form = DateFormatter("%b-%y")
@@ -102,19 +110,10 @@ if page == 'Drivers':
     
     view = st.selectbox("Select a way to view the data:",['Counts','Percents'])
             
-    data_2 = stops
-    data_2['year'] = pd.DatetimeIndex(data_2['Month_of_Stop']).year
-    data_2['year'] = data_2['year'].astype(str)
-    data_2 = data_2[data_2['year'].str.contains('|'.join(selected_year))]
-    data_2['Was_a_Search_Conducted'] = data_2['Was_a_Search_Conducted'].astype(str)
-    data_2 = data_2[data_2['Driver_Race'].str.contains('|'.join(selected_options))]
-    
+    plot2 = queries.result_by_search(selected_year, selected_options, view)
     if view == 'Counts':
-        plot2 = data_2.groupby(['Result_of_Stop', 
-                                'Was_a_Search_Conducted']).size().reset_index().pivot(columns='Result_of_Stop', 
-                                                                                    index='Was_a_Search_Conducted', values=0).plot(kind='bar', stacked=True,color=outcomes)
+        plot2 = plot2.plot(kind='bar', stacked=True,color=outcomes)
     else:
-        plot2= pd.crosstab(data_2['Was_a_Search_Conducted'], data_2['Result_of_Stop']).apply(lambda r: r/r.sum()*100, axis=1)
         plot2 = plot2.plot.bar(figsize=(10,10), stacked=True, rot=0,color=outcomes)
         
     plot2.set_title("Result of Stop by 'Was a Search Conducted'")
@@ -131,17 +130,9 @@ if page == 'Drivers':
     st.text("")
     st.text("")
     
-    data_3 = stops
-    data_3 = data_3[data_3['Was_a_Search_Conducted']==1]
-    data_3['year'] = pd.DatetimeIndex(data_3['Month_of_Stop']).year
-    data_3['year'] = data_3['year'].astype(str)
-    data_3 = data_3[data_3['year'].str.contains('|'.join(selected_year))]
-    
     metric = st.selectbox("Select another variable to view the vehicle searches by:",['Driver Ethnicity','Driver Gender','Driver Age'])
     if metric == 'Driver Gender':
-        plot3 = data_3.groupby(['Was_a_Search_Conducted', 
-                                'Driver_Gender']).size().reset_index().pivot(columns='Was_a_Search_Conducted', 
-                                                                                    index='Driver_Gender', values=0).plot(kind='bar', stacked=False)
+        plot3 = queries.searches_by(selected_year, 'Driver_Gender').plot(kind='bar', stacked=False)
         plot3.set_title("Vehicle Searches by Driver Gender")
         plot3.set_xlabel("Driver Gender")
         plot3.set_xticklabels(['Female','Male'])
@@ -149,9 +140,7 @@ if page == 'Drivers':
         plot3.get_legend().remove()
         
     elif metric == 'Driver Ethnicity':
-        plot3 = data_3.groupby(['Was_a_Search_Conducted', 
-                                'Driver_Ethnicity']).size().reset_index().pivot(columns='Was_a_Search_Conducted', 
-                                                                                    index='Driver_Ethnicity',values=0).plot(kind='bar', stacked=False)
+        plot3 = queries.searches_by(selected_year, 'Driver_Ethnicity').plot(kind='bar', stacked=False)
         plot3.set_title("Vehicle Searches by Driver Ethnicity")
         plot3.set_xlabel("Driver Ethnicity")
         plot3.set_xticklabels(['Hispanic','Non-Hispanic'])
@@ -160,7 +149,7 @@ if page == 'Drivers':
 
     elif metric == 'Driver Age':
         binwidth = st.selectbox("Select the size for Driver's Age binwidth:",list(range(1,11)),index=4)
-        plot3 = sns.histplot(data_3['Driver_Age'],binwidth= binwidth)
+        plot3 = sns.histplot(queries.searches_by(selected_year, 'Driver_Age'),binwidth= binwidth)
         plot3.set_title("Vehicle Searches by Driver Age")
         plot3.set_xlabel("Driver Age")
         
@@ -172,6 +161,7 @@ if page == 'Drivers':
     st.pyplot()
      
 if page == 'CMPD Divisions & Officers':
+    queries = load_queries()
     
     colors = {'White': "#800000FF", 'Black': "#ADB17DFF", 'Asian': "#5B8FA8FF","Native American":"#725663FF","Other/Unknown":"#D49464FF"}
     
@@ -186,29 +176,8 @@ if page == 'CMPD Divisions & Officers':
         
     selected_year = st.sidebar.multiselect("Select one or both years of traffic stops:",['2020','2021'],default=['2020'])
     
-    data = stops
-    data['year'] = pd.DatetimeIndex(data['Month_of_Stop']).year
-    data['year'] = data['year'].astype(str)
-    data = data[data['year'].str.contains('|'.join(selected_year))]
-    
-    data = data[data['CMPD_Division'].str.contains('|'.join(selected_options))]
-    data['CMPD_Division'] = data['CMPD_Division'].str.replace(' Division', '')
-    
-    
-    
-    catorder= ["Black","White","Asian","Native American","Other/Unknown"]
-    div_order = ['Metro', 'North Tryon', 'North', 'University City', 'Central', 'Freedom', 'Westover','Hickory Grove',
-                 'Independence','Eastway','Steele Creek','Providence','South']
-    
-    div_order2 = [i for i in div_order if any(i for j in selected_options if str(j) in i)]
-    
-    
-    
-    cross_tab_prop = pd.crosstab(index=data['CMPD_Division'], columns=data['Driver_Race'],normalize="index")
-    cross_tab_prop.columns = pd.CategoricalIndex(cross_tab_prop.columns.values, 
-                                 ordered=True, 
-                                 categories=catorder)
-    plot = cross_tab_prop.sort_index(axis=1).loc[div_order2].plot(kind='bar',stacked=True,color=colors)
+    cross_tab_prop = queries.division_race_proportions(selected_year, selected_options)
+    plot = cross_tab_prop.plot(kind='bar',stacked=True,color=colors)
     
     
     plot.tick_params(axis='x', rotation=90)
@@ -226,36 +195,18 @@ if page == 'CMPD Divisions & Officers':
     st.text("")
     st.text("")
     
-    data2 = stops
-    data2['year'] = pd.DatetimeIndex(data2['Month_of_Stop']).year
-    data2['year'] = data2['year'].astype(str)
-    data2 = data2[data2['year'].str.contains('|'.join(selected_year))]
-    data2 = data2[data2['Was_a_Search_Conducted']==1]
-    data2 = data2[data2['CMPD_Division'].str.contains('|'.join(selected_options))]
-    data2['Officer_Years_of_Service'] = round(data2['Officer_Years_of_Service']/4) + (data2['Officer_Years_of_Service'] % 4 > 0)
-    
     #code line plot here
     view = st.selectbox("Select a way to view the data:",['Counts','Percents'])
     
+    plot2 = queries.searches_by_service_bucket(selected_year, selected_options, view)
     if view == 'Counts':
-        catorder= ["Black","White","Asian","Native American","Other/Unknown"]
-        plot2= pd.crosstab(index=data2['Officer_Years_of_Service'], columns=data2['Driver_Race'])
-        plot2.columns = pd.CategoricalIndex(plot2.columns.values, 
-                                 ordered=True, 
-                                 categories=catorder)
-        plot2 = plot2.sort_index(axis=1).plot.bar(stacked=True, color=colors)
+        plot2 = plot2.plot.bar(stacked=True, color=colors)
         plot2.set_ylabel("Count of Searches")
         
     else:
-        catorder= ["Black","White","Asian","Native American","Other/Unknown"]
-        plot2= pd.crosstab(index=data2['Officer_Years_of_Service'], columns=data2['Driver_Race'],normalize="index")
-        plot2.columns = pd.CategoricalIndex(plot2.columns.values, 
-                                 ordered=True, 
-                                 categories=catorder)
-        plot2 = plot2.sort_index(axis=1).plot.bar(figsize=(10,10),stacked=True, rot=0,color=colors)
+        plot2 = plot2.plot.bar(figsize=(10,10),stacked=True, rot=0,color=colors)
         plot2.set_ylabel("Percent of Searches")
         
-    plot2.set_xticklabels(['1-4','5-8','9-12','13-16','17-20','21-24','25-28','29-32','33-36'])
     plot2.tick_params(axis='x', rotation=0)
     plot2.set_xlabel("Officer Years of Service")
     plot2.set_title("Cumulative Vehicle Searches by Race for each grouping of Officer Years of Service")
@@ -0,0 +1,14 @@
+import argparse
+
+import stops_queries as sq
+
+# Prebuilds the memory-mapped snapshot the Streamlit data pages load. Run from the
+# repository root after exporting stops_2020_trimmed.csv:
+#   python Streamlit/build_snapshot.py
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the Streamlit stops snapshot.')
+    parser.add_argument('--csv', default='Streamlit/stops_2020_trimmed.csv')
+    parser.add_argument('--snapshot', default='Streamlit/stops_snapshot')
+    args = parser.parse_args()
+    print(sq.build_snapshot(args.csv, args.snapshot))
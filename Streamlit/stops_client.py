@@ -0,0 +1,49 @@
+import datetime
+import json
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import pandas as pd
+
+# Thin client for Aggregation_Service/stops_service.py. Exposes the same query methods
+# as stops_queries.LocalQueries, so the app can read its tables from the service instead
+# of loading the stops itself (set CMPD_STOPS_SERVICE=http://127.0.0.1:8050).
+
+
+def from_payload(payload):
+    if 'columns' not in payload:
+        return pd.Series(payload['data'], index=payload['index'], name=payload['name'], dtype='int64')
+    return pd.DataFrame(payload['data'], index=pd.Index(payload['index'], name=payload['index_name']),
+                        columns=pd.Index(payload['columns'], name=payload['columns_name']))
+
+
+class StopsServiceClient:
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def get(self, path, **params):
+        query = urlencode({k: v for k, v in params.items() if v is not None}, doseq=True)
+        with urlopen('{}/{}?{}'.format(self.url, path.lstrip('/'), query), timeout=self.timeout) as response:
+            return json.load(response)
+
+    def _query(self, name, **params):
+        return from_payload(self.get('queries/' + name, **params))
+
+    def stops_by_race_month(self, selected_year, selected_options):
+        data = self._query('stops_by_race_month', years=selected_year, races=selected_options)
+        data['Month_of_Stop'] = [datetime.date.fromisoformat(m) for m in data['Month_of_Stop']]
+        return data
+
+    def result_by_search(self, selected_year, selected_options, view='Counts'):
+        return self._query('result_by_search', years=selected_year, races=selected_options, view=view)
+
+    def searches_by(self, selected_year, column):
+        return self._query('searches_by', years=selected_year, column=column)
+
+    def division_race_proportions(self, selected_year, selected_options):
+        return self._query('division_race_proportions', years=selected_year, divisions=selected_options)
+
+    def searches_by_service_bucket(self, selected_year, selected_options, view='Counts'):
+        return self._query('searches_by_service_bucket', years=selected_year, divisions=selected_options, view=view)
@@ -0,0 +1,159 @@
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing_and_Modeling'))
+from compaction import compact_stops  # noqa: E402
+from officer_index import SERVICE_LABELS, service_bucket  # noqa: E402
+from stops_snapshot import load_snapshot, snapshot_current, snapshot_exists, write_snapshot  # noqa: E402
+
+# Aggregations behind the Streamlit pages. Kept free of streamlit/plotting imports
+# so they can be benchmarked and reused outside the app.
+
+RACE_ORDER = ["Black", "White", "Asian", "Native American", "Other/Unknown"]
+DIVISION_ORDER = ['Metro', 'North Tryon', 'North', 'University City', 'Central', 'Freedom', 'Westover',
+                  'Hickory Grove', 'Independence', 'Eastway', 'Steele Creek', 'Providence', 'South']
+# Years of the dashboard's stops (stops_2020_trimmed); the officer index also holds 2016-17
+DASHBOARD_YEARS = ['2020', '2021']
+# prepare_stops flips Was_a_Search_Conducted: the pages' 1 is code 0 in the officer index
+INDEX_SEARCH_CODE = 0
+
+
+def prepare_stops(stops):
+    # Same conversions the app applied right after reading the csv
+    stops['Month_of_Stop'] = pd.to_datetime(stops['Month_of_Stop']).dt.date
+    stops['Was_a_Search_Conducted'] = 1 - stops['Was_a_Search_Conducted']
+    stops['year'] = pd.DatetimeIndex(stops['Month_of_Stop']).year.astype(str)
+    return stops
+
+
+def _selected(column, options):
+    # An empty multiselect used to match everything through str.contains('')
+    if not options:
+        return pd.Series(True, index=column.index)
+    return column.isin(options)
+
+
+def load_stops(csv_path, snapshot_path):
+    # Memory-mapped snapshot when one has been built from the current csv, otherwise the
+    # csv itself. A stale snapshot is not rebuilt here: other workers may have it mapped.
+    if snapshot_current(snapshot_path, csv_path):
+        return load_snapshot(snapshot_path)
+    if snapshot_exists(snapshot_path):
+        warnings.warn('{} was not built from the current {}; reading the csv until '
+                      'Streamlit/build_snapshot.py is rerun'.format(snapshot_path, csv_path))
+    return compact_stops(prepare_stops(pd.read_csv(csv_path)))
+
+
+def build_snapshot(csv_path, snapshot_path):
+    return write_snapshot(compact_stops(prepare_stops(pd.read_csv(csv_path))), snapshot_path, csv_path)
+
+
+def _observed(column):
+    # crosstab/groupby list every category of a categorical column, not just the filtered ones
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.remove_unused_categories()
+    return column
+
+
+def filter_years(stops, selected_year):
+    return stops[_selected(stops['year'], selected_year)]
+
+
+def stops_by_race_month(stops, selected_year, selected_options):
+    data = filter_years(stops, selected_year)
+    data = data.groupby(['Driver_Race', 'Month_of_Stop'], as_index=False, observed=True)['Officer_Race'].count()
+    # observed=True does not keep multiple categorical keys sorted
+    data = data.sort_values(['Driver_Race', 'Month_of_Stop'], ignore_index=True)
+    return data[_selected(data['Driver_Race'], selected_options)]
+
+
+def result_by_search(stops, selected_year, selected_options, view='Counts'):
+    data = filter_years(stops, selected_year)
+    data = data[data['Driver_Race'].str.contains('|'.join(selected_options))]
+    searched = data['Was_a_Search_Conducted'].astype(int).astype(str)
+    if view == 'Counts':
+        return pd.crosstab(searched, _observed(data['Result_of_Stop']))
+    return pd.crosstab(searched, _observed(data['Result_of_Stop']), normalize='index') * 100
+
+
+def searches_by(stops, selected_year, column):
+    data = filter_years(stops, selected_year)
+    data = data[data['Was_a_Search_Conducted'] == 1]
+    if column == 'Driver_Age':
+        return data['Driver_Age']
+    return data.groupby(['Was_a_Search_Conducted', column], observed=True).size().reset_index().pivot(
+        columns='Was_a_Search_Conducted', index=column, values=0)
+
+
+def division_order(selected_options):
+    return [i for i in DIVISION_ORDER if any(i for j in selected_options if str(j) in i)]
+
+
+def division_race_proportions(stops, selected_year, selected_options):
+    data = filter_years(stops, selected_year)
+    data = data[data['CMPD_Division'].str.contains('|'.join(selected_options))]
+    divisions = data['CMPD_Division'].str.replace(' Division', '')
+    cross_tab_prop = pd.crosstab(index=divisions, columns=_observed(data['Driver_Race']), normalize="index")
+    cross_tab_prop.columns = pd.CategoricalIndex(cross_tab_prop.columns.values, ordered=True,
+                                                 categories=RACE_ORDER)
+    return cross_tab_prop.sort_index(axis=1).loc[division_order(selected_options)]
+
+
+def _service_table(table, view):
+    if view != 'Counts':
+        table = table.div(table.sum(axis=1), axis=0)
+    table.columns = pd.CategoricalIndex(table.columns.values, ordered=True, categories=RACE_ORDER)
+    return table.sort_index(axis=1)
+
+
+def searches_by_service_bucket(stops, selected_year, selected_options, view='Counts'):
+    data = filter_years(stops, selected_year)
+    data = data[data['Was_a_Search_Conducted'] == 1]
+    data = data[data['CMPD_Division'].str.contains('|'.join(selected_options))]
+    # the officer index's buckets: 0, 1-4, 5-8, ..., 33-36, 37+ years of service
+    buckets = pd.Series(pd.Categorical.from_codes(service_bucket(data['Officer_Years_of_Service']), SERVICE_LABELS,
+                                                  ordered=True), index=data.index, name='Officer_Years_of_Service')
+    table = pd.crosstab(index=_observed(buckets), columns=_observed(data['Driver_Race']))
+    table.index = pd.Index(table.index.astype(str), name='Officer_Years_of_Service')
+    return _service_table(table, view)
+
+
+def indexed_searches_by_service_bucket(officer_index, selected_year, selected_options, view='Counts'):
+    # searches_by_service_bucket read from a precomputed officer_index.OfficerIndex
+    divisions = officer_index.counts['CMPD_Division'].unique()
+    if selected_options:
+        divisions = [d for d in divisions if any(str(o) in str(d) for o in selected_options)]
+    # an empty year selection means every year of the dashboard's stops, not of the index
+    table = officer_index.service_table(selected_year or DASHBOARD_YEARS, list(divisions), INDEX_SEARCH_CODE)
+    return _service_table(table.astype(np.int64), view)
+
+
+class LocalQueries:
+    # The page queries bound to an in-process stops frame; stops_client.StopsServiceClient
+    # offers the same methods backed by the aggregation service. With an officer index the
+    # years-of-service chart is read from it instead of the stops.
+
+    def __init__(self, stops, officer_index=None):
+        self.stops = stops
+        self.officer_index = officer_index
+
+    def stops_by_race_month(self, selected_year, selected_options):
+        return stops_by_race_month(self.stops, selected_year, selected_options)
+
+    def result_by_search(self, selected_year, selected_options, view='Counts'):
+        return result_by_search(self.stops, selected_year, selected_options, view)
+
+    def searches_by(self, selected_year, column):
+        return searches_by(self.stops, selected_year, column)
+
+    def division_race_proportions(self, selected_year, selected_options):
+        return division_race_proportions(self.stops, selected_year, selected_options)
+
+    def searches_by_service_bucket(self, selected_year, selected_options, view='Counts'):
+        if self.officer_index is not None:
+            return indexed_searches_by_service_bucket(self.officer_index, selected_year, selected_options, view)
+        return searches_by_service_bucket(self.stops, selected_year, selected_options, view)
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing_and_Modeling'))
+
+from compaction import compact_stops  # noqa: E402
+from drift_monitor import DriftMonitor, monthly_aggregates  # noqa: E402
+
+# The monitor is fed compacted frames by the pipeline (update_monitor) and raw processed
+# csvs by its CLI; both must give the same aggregates.
+
+
+def processed_stops(months, seed=0):
+    # Processed stops as read back from the exported csv: 0/1 int flags, string labels
+    rng = np.random.default_rng(seed)
+    n = 50 * len(months)
+    return pd.DataFrame({
+        'Month_of_Stop': np.repeat(months, 50),
+        'Driver_Race': rng.choice(['Black', 'White', 'Asian'], n),
+        'CMPD_Division': rng.choice(['North', 'South', 'Metro'], n),
+        'Reason_for_Stop': rng.choice(['Speeding', 'Vehicle Equipment'], n),
+        'Outcome': rng.choice(['Citation Issued', 'Verbal Warning'], n),
+        'Arrest': rng.choice(['Arrest', 'No Arrest'], n),
+        'Was_a_Search_Conducted': rng.integers(0, 2, n),
+        'Officer_Gender': rng.integers(0, 2, n),
+    })
+
+
+def test_flag_labels_do_not_depend_on_compaction():
+    stops = processed_stops(['2020-01-01', '2020-02-01'])
+    raw = monthly_aggregates(stops)
+    compacted = monthly_aggregates(compact_stops(stops.copy()))
+    assert compact_stops(stops.copy())['Was_a_Search_Conducted'].dtype == bool
+    pd.testing.assert_frame_equal(raw, compacted)
+    assert set(raw.loc[raw['dimension'] == 'Was_a_Search_Conducted', 'value']) == {'0', '1'}
+
+
+def test_csv_month_after_pipeline_months_shows_no_drift(tmp_path):
+    stops = processed_stops(['2020-01-01', '2020-02-01'])
+    monitor = DriftMonitor(str(tmp_path))
+    monitor.update(compact_stops(stops[stops['Month_of_Stop'] == '2020-01-01'].copy()))
+    # The same stops again as the next month, read from the csv by the CLI
+    repeat = stops[stops['Month_of_Stop'] == '2020-01-01'].assign(Month_of_Stop='2020-02-01')
+    path = os.path.join(str(tmp_path), 'stops.csv')
+    repeat.to_csv(path, index=False)
+    assert DriftMonitor(str(tmp_path)).update(pd.read_csv(path)) == ['2020-02']
+    drift = DriftMonitor(str(tmp_path)).monthly_drift('Was_a_Search_Conducted')
+    assert drift['psi'].iloc[0] < 1e-9
+    assert drift['p_value'].iloc[0] > 0.99
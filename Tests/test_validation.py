@@ -0,0 +1,48 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Preprocessing_and_Modeling'))
+
+from validation import ValidationReport, rule_masks  # noqa: E402
+
+# A value that is not a number in a range column (here an age of 'unknown') must be
+# reported as a violation instead of aborting the ingest.
+
+
+def raw_chunk(ages):
+    n = len(ages)
+    return pd.DataFrame({
+        'Month_of_Stop': pd.to_datetime(['2020-01-01'] * n),
+        'Reason_for_Stop': ['Speeding'] * n,
+        'Officer_Race': ['White'] * n,
+        'Officer_Gender': ['Male'] * n,
+        'Officer_Years_of_Service': [5] * n,
+        'Driver_Race': ['Black'] * n,
+        'Driver_Ethnicity': ['Non-Hispanic'] * n,
+        'Driver_Gender': ['Female'] * n,
+        'Driver_Age': ages,
+        'Was_a_Search_Conducted': ['No'] * n,
+        'Result_of_Stop': ['Verbal Warning'] * n,
+        'CMPD_Division': ['North Division'] * n,
+    })
+
+
+def test_garbage_age_is_a_type_violation():
+    masks = rule_masks(raw_chunk(['34', 'unknown', '12', None]))
+    assert masks['Driver_Age:type'].tolist() == [False, True, False, False]
+    assert masks['Driver_Age:range'].tolist() == [False, False, True, False]
+    assert masks['Driver_Age:null'].tolist() == [False, False, False, True]
+
+
+def test_garbage_age_is_quarantined():
+    report = ValidationReport('quarantine')
+    chunk = report.validate(raw_chunk(['34', 'unknown', '40']), np.array([101, 102, 103]), 'extract.csv')
+    assert len(chunk) == 2
+    assert report.counts == {'Driver_Age:type': 1}
+    quarantine = report.quarantine()
+    assert quarantine['source_id'].tolist() == [102]
+    assert quarantine['Driver_Age'].tolist() == ['unknown']
+    assert quarantine['violations'].tolist() == ['Driver_Age:type']